@@ -0,0 +1,64 @@
+import os
+import re
+
+
+class Affinity:
+
+    def __init__(self, config, database, repository, build):
+        self.config = config
+        self.database = database
+        self.repository = repository
+        self.build = build
+
+
+
+    # caches()
+    #
+    # find the warm caches on this host
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - list with dictionaries: 'branch_name_prefix', 'revision', 'snapshot', 'ccache'
+    # note:
+    #  - a snapshot only counts if it is built from the current revision
+    #    of the branch, jobs always test the top of the branch
+    def caches(self):
+        prefixes = set()
+        if (os.path.isdir(self.build.snapshot_base)):
+            for entry in os.scandir(self.build.snapshot_base):
+                entry_match = re.match(r'^(.+)_[0-9a-f]{40}_[0-9a-f]+$', entry.name)
+                if (entry_match and entry.is_dir()):
+                    prefixes.add(entry_match.group(1))
+        if (self.config.get('ccache') is True and os.path.isdir(self.build.ccache_base)):
+            for entry in os.scandir(self.build.ccache_base):
+                if (entry.is_dir()):
+                    prefixes.add(entry.name)
+
+        result = []
+        for prefix in sorted(prefixes):
+            revision = self.repository.branch_revision(prefix)
+            if (revision is False):
+                continue
+            snapshot = os.path.join(self.build.snapshot_base,
+                                    self.build.snapshot_name({'branch_name_prefix': prefix, 'git_revision': revision}))
+            result.append({'branch_name_prefix': prefix,
+                           'revision': revision,
+                           'snapshot': os.path.isfile(os.path.join(snapshot, 'testtool_snapshot_ok')),
+                           'ccache': os.path.isdir(self.build.ccache_dir(prefix))})
+
+        return result
+
+
+
+    # advertise()
+    #
+    # publish the warm caches and the free slots of this host
+    #
+    # parameter:
+    #  - self
+    #  - number of free job slots
+    # return:
+    #  none
+    def advertise(self, free_slots):
+        self.database.advertise_caches(free_slots, self.caches())
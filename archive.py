@@ -0,0 +1,97 @@
+import os
+import gzip
+import json
+import time
+import logging
+import threading
+
+
+class Archive:
+
+    def __init__(self, config, database):
+        self.config = config
+        self.database = database
+        self.archive_dir = os.path.join(config.get('cache-dir'), 'archive')
+        if (os.path.isdir(self.archive_dir) is False):
+            os.mkdir(self.archive_dir)
+        # the partitions are maintained once a day
+        self.interval = 86400
+        self.last_run = 0
+        self.thread = None
+
+
+
+    # maintain()
+    #
+    # create the next partitions, and archive old stage logs in the background
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    # note:
+    #  - every test host does this, the database makes sure that only one
+    #    host works on a partition
+    def maintain(self):
+        if (time.time() - self.last_run < self.interval):
+            return
+
+        for name in self.database.create_partitions(self.config.get('partitions-ahead')):
+            logging.info("created partition: " + name)
+        # on errors, try again with the next poll
+        self.last_run = time.time()
+
+        if (self.config.get('archive-after') > 0 and (self.thread is None or self.thread.is_alive() is False)):
+            self.thread = threading.Thread(target = self.run, name = 'archive', daemon = True)
+            self.thread.start()
+
+
+
+    # run()
+    #
+    # archive all partitions with old stage logs
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def run(self):
+        try:
+            for partition in self.database.archivable_partitions(self.config.get('archive-after')):
+                self.archive(partition)
+        except Exception:
+            logging.exception("archiving stage logs failed")
+
+
+
+    # archive()
+    #
+    # write the stage logs of a partition into a file, and drop the partition
+    #
+    # parameter:
+    #  - self
+    #  - partition (from Database.archivable_partitions())
+    # return:
+    #  - True/False
+    # note:
+    #  - one JSON document per line, compressed: <cache-dir>/archive/<partition>.jsonl.gz
+    #  - the file is complete before the partition is dropped
+    def archive(self, partition):
+        filename = os.path.join(self.archive_dir, partition['name'] + '.jsonl.gz')
+        start_time = time.time()
+        counter = [0]
+
+        def write_rows(rows):
+            with gzip.open(filename + '.tmp', 'wt') as fh:
+                for row in rows:
+                    fh.write(json.dumps(row, default = str) + "\n")
+                    counter[0] += 1
+            os.rename(filename + '.tmp', filename)
+
+        logging.info("archive stage logs: " + partition['name'])
+        if (self.database.archive_partition(partition, write_rows) is False):
+            logging.info("partition " + partition['name'] + " is archived by another host")
+            return False
+        logging.info("archived " + str(counter[0]) + " stage logs into " + filename + " in " + str(round(time.time() - start_time, 1)) + "s")
+
+        return True
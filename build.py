@@ -0,0 +1,851 @@
+import os
+import re
+import time
+import shutil
+import logging
+import threading
+import subprocess
+from regress import Regress
+from impact import Impact
+
+
+class Build:
+
+    def __init__(self, config, scheduler, repository, patch, history):
+        self.config = config
+        self.scheduler = scheduler
+        self.repository = repository
+        self.patch = patch
+        self.history = history
+        # pristine builds, one per branch, revision and configure options
+        self.snapshot_base = os.path.join(config.get('cache-dir'), 'snapshots')
+        # prefix of all snapshot builds, jobs install with DESTDIR
+        self.snapshot_prefix = '/usr/local/pgsql'
+        self.snapshot_locks = {}
+        # jobs which are copying a snapshot, per snapshot name
+        self.snapshot_readers = {}
+        self.ccache_base = os.path.join(config.get('cache-dir'), 'ccache')
+        self.snapshot_locks_lock = threading.Lock()
+        # a patch touching one of these files needs a new 'configure' run
+        self.configure_files = ['configure', 'configure.in', 'configure.ac', 'aclocal.m4',
+                                'src/Makefile.global.in', 'src/include/pg_config.h.in']
+        # GNU make 4 can group the output of parallel targets
+        self.make_output_sync = self.make_supports_output_sync()
+        self.impact = Impact()
+        # settings for all test instances, the test data is thrown away
+        self.temp_config = "fsync = off\n"
+        # the output of a stage which ran out of space
+        self.out_of_space = 'No space left on device'
+
+
+
+    # make_supports_output_sync()
+    #
+    # verify if 'make' supports the '--output-sync' option
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - True/False
+    def make_supports_output_sync(self):
+        try:
+            v = subprocess.check_output(['make', '--version'], stderr = subprocess.DEVNULL).decode()
+        except (OSError, subprocess.CalledProcessError):
+            return False
+        v_r = re.match(r'GNU Make (\d+)', v)
+        if (v_r and int(v_r.group(1)) >= 4):
+            return True
+
+        return False
+
+
+
+    # ccache_dir()
+    #
+    # return the compiler cache directory for a branch
+    #
+    # parameter:
+    #  - self
+    #  - branch name prefix
+    # return:
+    #  - directory name
+    # note:
+    #  - every branch has its own cache, the branches share almost no objects
+    #    and would evict each other
+    def ccache_dir(self, prefix):
+        return os.path.join(self.ccache_base, prefix)
+
+
+
+    # init_ccache()
+    #
+    # create the compiler cache for a branch, and set the maximum size
+    #
+    # parameter:
+    #  - self
+    #  - branch name prefix
+    # return:
+    #  none
+    def init_ccache(self, prefix):
+        dir = self.ccache_dir(prefix)
+        if (os.path.isdir(dir) is False):
+            os.makedirs(dir)
+        env = os.environ.copy()
+        env['CCACHE_DIR'] = dir
+        subprocess.call([self.config.get('ccache-bin'), '-M', self.config.get('ccache-max-size')], env = env,
+                        stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+
+
+
+    # build_env()
+    #
+    # return the environment for all build commands of a job
+    #
+    # parameter:
+    #  - self
+    #  - job
+    #  - top directory of the build (optional, default is the job directory)
+    # return:
+    #  - dictionary with environment
+    def build_env(self, job, build_dir = None):
+        if (build_dir is None):
+            build_dir = job['build-dir']
+        env = os.environ.copy()
+        env['LC_ALL'] = 'C'
+        if (self.config.get('ccache') is True):
+            self.init_ccache(job['branch_name_prefix'])
+            env['CCACHE_DIR'] = self.ccache_dir(job['branch_name_prefix'])
+            # every job builds in a different directory, hash relative paths only
+            env['CCACHE_BASEDIR'] = build_dir
+            env['CCACHE_NOHASHDIR'] = '1'
+            # statistics for this job only, the cache is shared
+            env['CCACHE_STATSLOG'] = os.path.join(build_dir, 'ccache-stats.log')
+            env['CC'] = self.config.get('ccache-bin') + ' ' + env.get('CC', 'gcc')
+
+        return env
+
+
+
+    # ccache_stats()
+    #
+    # count the cache hits and misses of a job
+    #
+    # parameter:
+    #  - self
+    #  - job
+    # return:
+    #  - list with hits and misses, or [None, None]
+    def ccache_stats(self, job):
+        statslog = os.path.join(job['build-dir'], 'ccache-stats.log')
+        if (self.config.get('ccache') is False or os.path.isfile(statslog) is False):
+            return [None, None]
+
+        hits = 0
+        misses = 0
+        with open(statslog, 'r') as fh:
+            for line in fh:
+                line = line.strip()
+                if (line.endswith('_cache_hit')):
+                    hits += 1
+                elif (line == 'cache_miss'):
+                    misses += 1
+
+        return [hits, misses]
+
+
+
+    # snapshot_lock()
+    #
+    # return the lock for a single snapshot
+    #
+    # parameter:
+    #  - self
+    #  - snapshot name
+    # return:
+    #  - lock
+    def snapshot_lock(self, name):
+        with self.snapshot_locks_lock:
+            if not (name in self.snapshot_locks):
+                self.snapshot_locks[name] = threading.Lock()
+            return self.snapshot_locks[name]
+
+
+
+    # release_snapshot()
+    #
+    # a job finished copying a snapshot
+    #
+    # parameter:
+    #  - self
+    #  - snapshot name
+    # return:
+    #  none
+    def release_snapshot(self, name):
+        with self.snapshot_locks_lock:
+            self.snapshot_readers[name] -= 1
+            if (self.snapshot_readers[name] == 0):
+                del self.snapshot_readers[name]
+
+
+
+    # snapshot_options()
+    #
+    # return the configure options for a snapshot build
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - list with configure options
+    # note:
+    #  - jobs only compile the changed files again, without dependency
+    #    tracking a changed header does not rebuild the objects using it
+    def snapshot_options(self):
+        options = list(self.config.get('build-options'))
+        if not ('--enable-depend' in options):
+            options.append('--enable-depend')
+
+        return options
+
+
+
+    # snapshot_name()
+    #
+    # return the name of the snapshot for a job
+    #
+    # parameter:
+    #  - self
+    #  - job
+    # return:
+    #  - snapshot name
+    def snapshot_name(self, job):
+        options = self.config.create_hashname(' '.join(self.snapshot_options()))
+        return job['branch_name_prefix'] + '_' + job['git_revision'] + '_' + options[:12]
+
+
+
+    # get_snapshot()
+    #
+    # return the pristine build for a job, build it if required
+    #
+    # parameter:
+    #  - self
+    #  - job
+    # return:
+    #  - snapshot directory, or False
+    # note:
+    #  - the first job for a snapshot builds it, all other jobs wait
+    #  - the snapshot is not removed until the job calls release_snapshot()
+    def get_snapshot(self, job):
+        name = self.snapshot_name(job)
+        dir = os.path.join(self.snapshot_base, name)
+        with self.snapshot_lock(name):
+            if not (os.path.isfile(os.path.join(dir, 'testtool_snapshot_ok'))):
+                # building the snapshot is CPU heavy
+                with self.scheduler.cpu_slot(job):
+                    result = self.create_snapshot(job, name)
+                if (result is False):
+                    return False
+            with self.snapshot_locks_lock:
+                self.snapshot_readers[name] = self.snapshot_readers.get(name, 0) + 1
+        self.prune_snapshots(job['branch_name_prefix'], name)
+
+        return dir
+
+
+
+    # create_snapshot()
+    #
+    # configure and build the unpatched source
+    #
+    # parameter:
+    #  - self
+    #  - job
+    #  - snapshot name
+    # return:
+    #  - True/False
+    def create_snapshot(self, job, name):
+        dir = os.path.join(self.snapshot_base, name)
+        tmp = dir + '.tmp'
+        logging.info("job " + str(job['id']) + ": building snapshot " + name)
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        source = os.path.join(tmp, 'source')
+        if (self.repository.add_worktree(source, job['branch_name_prefix'], job['git_revision']) is False):
+            shutil.rmtree(tmp, ignore_errors=True)
+            return False
+
+        env = self.build_env(job, tmp)
+        log = open(os.path.join(tmp, 'snapshot.log'), 'wb')
+        result = True
+        for cmd in [['./configure'] + self.snapshot_options(),
+                    ['make'] + self.scheduler.make_parallel_flags()]:
+            if (subprocess.call(cmd, cwd = source, env = env, stdout = log, stderr = subprocess.STDOUT) != 0):
+                logging.error("job " + str(job['id']) + ": building snapshot " + name + " failed: " + ' '.join(cmd))
+                result = False
+                break
+        log.close()
+
+        # the snapshot is a plain tree, not a worktree
+        self.repository.remove_worktree_metadata(source)
+        if (result is False):
+            shutil.rmtree(tmp, ignore_errors=True)
+            return False
+
+        open(os.path.join(tmp, 'testtool_snapshot_ok'), 'w').close()
+        shutil.rmtree(dir, ignore_errors=True)
+        os.rename(tmp, dir)
+
+        return True
+
+
+
+    # prune_snapshots()
+    #
+    # remove older snapshots of a branch
+    #
+    # parameter:
+    #  - self
+    #  - branch name prefix
+    #  - snapshot name to keep
+    # return:
+    #  none
+    # note:
+    #  - new jobs only use the snapshot for the current revision, snapshots
+    #    which are still copied are removed the next time
+    def prune_snapshots(self, prefix, keep):
+        for entry in os.scandir(self.snapshot_base):
+            if (entry.name == keep or entry.name.startswith(prefix + '_') is False or entry.is_dir() is False):
+                continue
+            # the branch prefix can be the start of another prefix
+            name_match = re.match('(' + re.escape(prefix) + r'_[0-9a-f]{40}_[0-9a-f]+)(\.tmp)?$', entry.name)
+            if (name_match is None or name_match.group(1) == keep):
+                continue
+            # a snapshot which is built in '.tmp' is locked by its final name
+            with self.snapshot_lock(name_match.group(1)):
+                with self.snapshot_locks_lock:
+                    if (name_match.group(1) in self.snapshot_readers):
+                        continue
+                logging.info("remove snapshot: " + entry.name)
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+
+
+    # prepare_source()
+    #
+    # prepare the source directory for a job
+    #
+    # parameter:
+    #  - self
+    #  - job
+    #  - StageLog
+    # return:
+    #  - True/False
+    # note:
+    #  - with snapshots, the job gets a copy of the pristine build, only the
+    #    files touched by the patches are compiled again
+    #  - without snapshots, the job gets a new worktree
+    def prepare_source(self, job, log):
+        job['source-dir'] = os.path.join(job['build-dir'], 'source')
+        job['install-dir'] = os.path.join(job['build-dir'], 'install')
+        job['make-args'] = []
+        job['install-args'] = []
+        job['snapshot'] = False
+
+        if (self.config.get('build-snapshots') is True):
+            snapshot = self.get_snapshot(job)
+            if (snapshot is not False):
+                log.write("snapshot: " + snapshot + "\n")
+                # copy-on-write, if the filesystem supports it
+                try:
+                    ret = log.run(['cp', '-a', '--reflink=auto', os.path.join(snapshot, 'source'), job['source-dir']], cwd = job['build-dir'])
+                finally:
+                    self.release_snapshot(os.path.basename(snapshot))
+                if (ret == 0):
+                    job['snapshot'] = True
+                    # Makefile.global points to the snapshot directory
+                    job['make-args'] = ['abs_top_builddir=' + job['source-dir'], 'abs_top_srcdir=' + job['source-dir']]
+                    job['install-args'] = ['DESTDIR=' + job['install-dir']]
+                    job['install-dir'] = job['install-dir'] + self.snapshot_prefix
+                    return True
+                shutil.rmtree(job['source-dir'], ignore_errors=True)
+            logging.warning("job " + str(job['id']) + ": no snapshot, full build")
+
+        return self.repository.add_worktree(job['source-dir'], job['branch_name_prefix'], job['git_revision'])
+
+
+
+    # apply_patches()
+    #
+    # apply all patches of a job to the source
+    #
+    # parameter:
+    #  - self
+    #  - job
+    #  - StageLog
+    # return:
+    #  - return code
+    def apply_patches(self, job, log):
+        for filename in job['patch-files']:
+            ret = log.run([self.config.get('git-bin'), 'apply', '--whitespace=nowarn', filename], cwd = job['source-dir'])
+            if (ret != 0):
+                return ret
+
+        return 0
+
+
+
+    # configure()
+    #
+    # run 'configure'
+    #
+    # parameter:
+    #  - self
+    #  - job
+    #  - StageLog
+    # return:
+    #  - return code
+    def configure(self, job, log):
+        if (job['snapshot'] is True):
+            # keep the prefix and the options of the snapshot, the job installs with DESTDIR
+            return log.run(['./configure'] + self.snapshot_options(),
+                           cwd = job['source-dir'], env = job['env'])
+        return log.run(['./configure', '--prefix=' + job['install-dir']] + self.config.get('build-options'),
+                       cwd = job['source-dir'], env = job['env'])
+
+
+
+    # make()
+    #
+    # compile the source
+    #
+    # parameter:
+    #  - self
+    #  - job
+    #  - StageLog
+    # return:
+    #  - return code
+    # note:
+    #  - the ccache statistics only count 'make', configure also compiles
+    #    test programs
+    def make(self, job, log):
+        statslog = os.path.join(job['build-dir'], 'ccache-stats.log')
+        if (os.path.isfile(statslog)):
+            os.remove(statslog)
+        ret = log.run(['make'] + self.scheduler.make_parallel_flags() + job['make-args'], cwd = job['source-dir'], env = job['env'])
+        job['ccache_hits'], job['ccache_misses'] = self.ccache_stats(job)
+        if (job['ccache_hits'] is not None):
+            log.write("# ccache: " + str(job['ccache_hits']) + " hits, " + str(job['ccache_misses']) + " misses\n")
+
+        return ret
+
+
+
+    # make_docs()
+    #
+    # build the documentation only
+    #
+    # parameter:
+    #  - self
+    #  - job
+    #  - StageLog
+    # return:
+    #  - return code
+    # note:
+    #  - 'check' validates the markup, and does not require the stylesheets
+    def make_docs(self, job, log):
+        return log.run(['make', '-C', os.path.join('doc', 'src', 'sgml'), 'check'] + job['make-args'],
+                       cwd = job['source-dir'], env = job['env'])
+
+
+
+    # install()
+    #
+    # install the binaries into the job directory
+    #
+    # parameter:
+    #  - self
+    #  - job
+    #  - StageLog
+    # return:
+    #  - return code
+    def install(self, job, log):
+        ret = log.run(['make', 'install'] + job['make-args'] + job['install-args'], cwd = job['source-dir'], env = job['env'])
+        if (ret == 0):
+            self.read_version(job)
+
+        return ret
+
+
+
+    # tests()
+    #
+    # run the regression tests
+    #
+    # parameter:
+    #  - self
+    #  - job
+    #  - StageLog
+    # return:
+    #  - return code
+    # note:
+    #  - the test instances run on the RAM disk, if one is configured, the
+    #    tests run again on disk if the RAM disk is full
+    #  - 'out-of-space' is set if the last run failed because the disk is full
+    def tests(self, job, log):
+        tmpfs_args = self.prepare_tmpfs(job, log)
+        start = log.size
+        ret = self.run_tests(job, log, tmpfs_args)
+        if (ret != 0 and len(tmpfs_args) > 0 and log.contains(self.out_of_space, start) is True):
+            log.write("# RAM disk is full, run the tests again on disk\n")
+            self.remove_tmpfs(job)
+            start = log.size
+            ret = self.run_tests(job, log, [])
+        self.remove_tmpfs(job)
+        # only the disk counts, a full RAM disk is not a reason to requeue
+        job['out-of-space'] = (ret != 0 and log.contains(self.out_of_space, start) is True)
+
+        return ret
+
+
+
+    # run_tests()
+    #
+    # run the regression tests, in the configured mode
+    #
+    # parameter:
+    #  - self
+    #  - job
+    #  - StageLog
+    #  - list with additional 'make' arguments
+    # return:
+    #  - return code
+    # note:
+    #  - in 'ordered' and 'quick' mode the known suites of the branch run one
+    #    by one, the most likely failures first, 'quick' stops at the first
+    #    failure, suites without history run at the end
+    #  - suites which run one by one share a single temporary installation
+    #  - in 'targeted' mode only the suites affected by the patch run, all
+    #    tests run if the patch touches the build system
+    #  - without history for the branch, all tests run
+    def run_tests(self, job, log, extra_args):
+        regress = Regress(job['source-dir'])
+        suites = []
+        if (self.config.get('tests-mode') == 'targeted'):
+            suites = self.targeted_suites(job, log)
+        elif (self.config.get('tests-mode') != 'full'):
+            suites = self.history.suite_order(job['branch_name_prefix'], self.patch.touched_files(job['patch-files']))
+            if (len(suites) > 0):
+                suites += [suite for suite in self.available_suites(job) if not (suite in suites)]
+
+        if (len(suites) == 0):
+            ret = log.run(['make'] + self.test_flags(job) + job['make-args'] + extra_args, cwd = job['source-dir'],
+                          env = job['env'], line_callback = regress.parse_line)
+        else:
+            ret = 0
+            if (self.uses_tmp_install(job) is True):
+                # install once, instead of once per suite
+                ret = log.run(['make', 'temp-install'] + self.scheduler.make_parallel_flags() + job['make-args'] + extra_args,
+                              cwd = job['source-dir'], env = job['env'])
+                if (ret != 0):
+                    job['test_timings'] = regress.result()
+                    return ret
+                extra_args = extra_args + ['NO_TEMP_INSTALL=yes']
+            for suite in suites:
+                if (os.path.isdir(os.path.join(job['source-dir'], suite)) is False):
+                    continue
+                suite_ret = log.run(['make', '-C', suite, 'check'] + self.test_parallel_flags() + job['make-args'] + extra_args,
+                                    cwd = job['source-dir'], env = job['env'], line_callback = regress.parse_line)
+                if (suite_ret != 0):
+                    ret = suite_ret
+                    if (self.config.get('tests-mode') == 'quick'):
+                        log.write("# quick mode: stop after first failed suite (" + suite + ")\n")
+                        break
+        job['test_timings'] = regress.result()
+        self.history.record(job['branch_name_prefix'], job['test_timings'])
+
+        return ret
+
+
+
+    # available_suites()
+    #
+    # find all test suites in the source of a job
+    #
+    # parameter:
+    #  - self
+    #  - job
+    # return:
+    #  - sorted list with suite directories, relative to the source
+    # note:
+    #  - a suite is a directory with regression, isolation or TAP tests,
+    #    directories below a suite belong to the suite
+    def available_suites(self, job):
+        result = []
+        for top in ['contrib', 'src']:
+            for dir, subdirs, files in os.walk(os.path.join(job['source-dir'], top)):
+                subdirs.sort()
+                if not ('Makefile' in files):
+                    continue
+                with open(os.path.join(dir, 'Makefile'), 'r', errors = 'replace') as fh:
+                    makefile = fh.read()
+                if (re.search(r'^(REGRESS|ISOLATION|TAP_TESTS)\s*[:+]?=|\$\((prove_check|pg_regress_check|pg_isolation_regress_check)\)|^check\s*:', makefile, re.M)):
+                    result.append(os.path.relpath(dir, job['source-dir']))
+                    # the suite runs everything below
+                    subdirs[:] = []
+
+        return sorted(result)
+
+
+
+    # tmpfs_dir()
+    #
+    # return the directory of a job on the RAM disk
+    #
+    # parameter:
+    #  - self
+    #  - job
+    # return:
+    #  - directory name
+    def tmpfs_dir(self, job):
+        return os.path.join(self.config.get('tmpfs-dir'), os.path.basename(job['build-dir']))
+
+
+
+    # prepare_tmpfs()
+    #
+    # place the test instances on the RAM disk
+    #
+    # parameter:
+    #  - self
+    #  - job
+    #  - StageLog
+    # return:
+    #  - list with additional 'make' arguments
+    # note:
+    #  - pg_regress creates the instance in the directory given by the last
+    #    '--temp-instance' option, but does not create parent directories,
+    #    every suite gets its own directory in the job directory, named after
+    #    the suite directory with '/' replaced
+    #  - the TAP tests and the temporary installation stay on disk, but the
+    #    temporary config disables fsync for all instances
+    #  - older branches (before 9.5) install per suite, and keep the
+    #    instances on disk
+    def prepare_tmpfs(self, job, log):
+        if (self.config.get('tmpfs-dir') is False):
+            return []
+
+        temp_config = os.path.join(job['build-dir'], 'testtool_temp.conf')
+        with open(temp_config, 'w') as fh:
+            fh.write(self.temp_config)
+        job['env']['TEMP_CONFIG'] = temp_config
+
+        if (self.uses_tmp_install(job) is False):
+            return []
+        free = shutil.disk_usage(self.config.get('tmpfs-dir')).free
+        if (free < self.config.get('tmpfs-space') * 1024 * 1024):
+            log.write("# RAM disk has only " + self.config.human_size(free) + " free space, tests run on disk\n")
+            return []
+        dir = self.tmpfs_dir(job)
+        os.makedirs(dir, exist_ok = True)
+        log.write("# test instances on RAM disk: " + dir + "\n")
+
+        return ['EXTRA_REGRESS_OPTS=--temp-instance=' + dir + '/$(subst /,_,$(CURDIR))']
+
+
+
+    # remove_tmpfs()
+    #
+    # remove the test instances of a job from the RAM disk
+    #
+    # parameter:
+    #  - self
+    #  - job
+    # return:
+    #  none
+    def remove_tmpfs(self, job):
+        if (self.config.get('tmpfs-dir') is not False):
+            shutil.rmtree(self.tmpfs_dir(job), ignore_errors=True)
+
+
+
+    # targeted_suites()
+    #
+    # return the suites affected by the patches of a job
+    #
+    # parameter:
+    #  - self
+    #  - job
+    #  - StageLog
+    # return:
+    #  - list with suite names, empty if all tests have to run
+    # note:
+    #  - the suites run in the order of the history, likely failures first
+    def targeted_suites(self, job, log):
+        if (job['impact']['world'] is True):
+            log.write("# targeted mode: patch affects the build system, run all tests\n")
+            return []
+
+        order = self.history.suite_order(job['branch_name_prefix'], self.patch.touched_files(job['patch-files']))
+        suites = sorted(job['impact']['suites'], key = lambda s: order.index(s) if s in order else len(order))
+        log.write("# targeted mode: " + ', '.join(suites) + "\n")
+
+        return suites
+
+
+
+    # test_flags()
+    #
+    # choose the test target, and the parallelism for the tests
+    #
+    # parameter:
+    #  - self
+    #  - job
+    # return:
+    #  - list with 'make' arguments
+    # note:
+    #  - the parallelism follows the CPU share of the job
+    #  - suites only run in parallel if the branch uses a shared temporary
+    #    installation (9.5 and newer), older branches install per suite
+    def test_flags(self, job):
+        flags = ['-k']
+        with open(os.path.join(job['source-dir'], 'GNUmakefile'), 'r') as fh:
+            has_check_world = 'check-world' in fh.read()
+        has_tmp_install = self.uses_tmp_install(job)
+
+        if (has_check_world is True):
+            flags.append('check-world')
+        else:
+            flags.append('check')
+        if (has_check_world is True and has_tmp_install is True):
+            flags += self.scheduler.make_parallel_flags()
+            if (self.make_output_sync is True):
+                flags.append('--output-sync=target')
+        else:
+            # still print the directory, the suites are recognized by it
+            flags.append('-w')
+        flags += self.test_parallel_flags()
+
+        return flags
+
+
+
+    # uses_tmp_install()
+    #
+    # verify if the branch uses a shared temporary installation for all tests
+    #
+    # parameter:
+    #  - self
+    #  - job
+    # return:
+    #  - True/False
+    def uses_tmp_install(self, job):
+        with open(os.path.join(job['source-dir'], 'src', 'Makefile.global'), 'r') as fh:
+            return 'tmp_install' in fh.read()
+
+
+
+    # test_parallel_flags()
+    #
+    # parallelism within a single test suite
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - list with 'make' arguments
+    def test_parallel_flags(self):
+        jobs = self.scheduler.make_jobs()
+
+        return ['PROVE_FLAGS=-j' + str(jobs) + ' --timer', 'MAX_CONNECTIONS=' + str(max(2, 2 * jobs))]
+
+
+
+    # read_version()
+    #
+    # read the version of the installed binaries
+    #
+    # parameter:
+    #  - self
+    #  - job
+    # return:
+    #  none
+    def read_version(self, job):
+        pg_config = os.path.join(job['install-dir'], 'bin', 'pg_config')
+        try:
+            v = subprocess.check_output([pg_config, '--version'], stderr = subprocess.DEVNULL).decode().strip()
+        except (OSError, subprocess.CalledProcessError):
+            return
+        job['pg_version_str'] = v
+        v_r = re.match(r'PostgreSQL ([\d\.]+\w*)', v)
+        if (v_r):
+            job['pg_version'] = v_r.group(1)
+
+        try:
+            with open(os.path.join(job['source-dir'], 'src', 'include', 'pg_config.h'), 'r') as fh:
+                for line in fh:
+                    v_r = re.match(r'#define PG_VERSION_NUM (\d+)', line)
+                    if (v_r):
+                        job['pg_version_num'] = v_r.group(1)
+                        break
+        except IOError:
+            pass
+
+
+
+    # run()
+    #
+    # run all build and test stages of a job
+    #
+    # parameter:
+    #  - self
+    #  - job
+    #  - function which returns the StageLog for a stage
+    # return:
+    #  - job state ('failed', 'success')
+    def run(self, job, stage_log):
+        job['env'] = self.build_env(job)
+
+        # a resumed job is already patched
+        if (job.get('result_patch') != 0):
+            job['result_patch'] = self.apply_patches(job, stage_log('patch'))
+            if (job['result_patch'] != 0):
+                job['errorstr'] = 'patch does not apply'
+                return 'failed'
+
+        touched = self.patch.touched_files(job['patch-files'])
+        job['impact'] = self.impact.analyze(touched)
+        stages = [['configure', self.configure],
+                  ['make', self.make],
+                  ['install', self.install],
+                  ['tests', self.tests]]
+        if (self.config.get('tests-mode') == 'targeted' and job['impact']['docs-only'] is True):
+            # nothing to compile or test, only the documentation changes
+            stage_log('make').write("documentation only patch, build the documentation\n")
+            stages = [['configure', self.configure],
+                      ['make', self.make_docs]]
+
+        if (job['snapshot'] is True and not ('result_configure' in job)):
+            if (len(set(touched) & set(self.configure_files)) == 0):
+                # the snapshot is already configured
+                job['run_configure'] = True
+                job['result_configure'] = 0
+                stage_log('configure').write("configure skipped, using the snapshot\n")
+            else:
+                stage_log('configure').write("patch modifies the configuration, configure again\n")
+
+        # from here on the job needs CPU, the token is held until the tests are done
+        with self.scheduler.cpu_slot(job):
+            for stage, function in stages:
+                if (job.get('result_' + stage) == 0):
+                    continue
+                start_time = time.time()
+                job['run_' + stage] = True
+                job['result_' + stage] = function(job, stage_log(stage))
+                job['time_' + stage] = time.time() - start_time
+                if (job['result_' + stage] != 0):
+                    if not ('out-of-space' in job):
+                        job['out-of-space'] = stage_log(stage).contains(self.out_of_space)
+                    job['errorstr'] = stage + ' failed'
+                    logging.info("job " + str(job['id']) + ": " + job['errorstr'])
+                    return 'failed'
+
+        return 'success'
@@ -0,0 +1,268 @@
+import os
+import re
+import time
+import shutil
+import logging
+import threading
+import concurrent.futures
+
+
+class Cleanup:
+
+    def __init__(self, config, repository):
+        self.config = config
+        self.repository = repository
+        self.build_dir = config.get('build-dir')
+        self.cache_dir = config.get('cache-dir')
+        self.log_dir = config.get('log-dir')
+        # directories are renamed into the trash first, this is instant,
+        # removing a build tree with all the files takes a while
+        self.trash_dir = os.path.join(self.build_dir, '.trash')
+        if (os.path.isdir(self.trash_dir) is False):
+            os.mkdir(self.trash_dir)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers = 4)
+        self.lock = threading.Lock()
+        self.counter = 0
+
+
+
+    # remove()
+    #
+    # move a directory into the trash, and remove it in the background
+    #
+    # parameter:
+    #  - self
+    #  - directory name
+    # return:
+    #  - future of the removal
+    def remove(self, dir):
+        with self.lock:
+            self.counter += 1
+            trash = os.path.join(self.trash_dir, os.path.basename(dir) + '.' + str(os.getpid()) + '.' + str(self.counter))
+        os.rename(dir, trash)
+
+        return self.executor.submit(shutil.rmtree, trash, True)
+
+
+
+    # empty_trash()
+    #
+    # remove everything which is left in the trash
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    # note:
+    #  - the trash is not empty if the tool stopped during a removal
+    def empty_trash(self):
+        for entry in os.scandir(self.trash_dir):
+            logging.debug("remove from trash: " + entry.name)
+            if (entry.is_dir(follow_symlinks = False)):
+                self.executor.submit(shutil.rmtree, entry.path, True)
+            else:
+                os.remove(entry.path)
+
+
+
+    # builds()
+    #
+    # list all build directories
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - list with dictionaries: 'path', 'name', 'branch', 'used'
+    def builds(self):
+        result = []
+        for entry in os.scandir(self.build_dir):
+            if (re.match(r'^\d\d\d\d\-\d\d\-\d\d_\d\d\d\d\d\d_\d+$', entry.name) is None or entry.is_dir(follow_symlinks = False) is False):
+                continue
+            branch = ''
+            try:
+                with open(os.path.join(entry.path, 'testtool_branch'), 'r') as fh:
+                    branch = fh.read().strip()
+            except IOError:
+                pass
+            result.append({'path': entry.path, 'name': entry.name, 'branch': branch,
+                           'used': entry.stat(follow_symlinks = False).st_mtime})
+
+        return result
+
+
+
+    # remove_test_files()
+    #
+    # remove the temporary installation and the test instances of a build
+    #
+    # parameter:
+    #  - self
+    #  - build (from builds())
+    # return:
+    #  none
+    # note:
+    #  - the output of the tests is in the stage log, the data directories
+    #    are only large
+    #  - every build is only searched once
+    def remove_test_files(self, build):
+        marker = os.path.join(build['path'], 'testtool_test_files_removed')
+        if (os.path.isfile(marker)):
+            return
+        for dir, subdirs, files in os.walk(build['path']):
+            for subdir in [d for d in subdirs if d in ['tmp_check', 'tmp_install']]:
+                self.remove(os.path.join(dir, subdir))
+                subdirs.remove(subdir)
+        open(marker, 'w').close()
+        # the marker must not count as a new use of the build
+        os.utime(build['path'], (build['used'], build['used']))
+
+
+
+    # remove_logs()
+    #
+    # remove the stage logs of old jobs
+    #
+    # parameter:
+    #  - self
+    #  - list with build directories which are in use
+    # return:
+    #  none
+    # note:
+    #  - the log directory of a job has the name of the build directory,
+    #    the stage logs of the running jobs are kept
+    #  - logs older than 'log-max-age' days are removed, and the oldest logs
+    #    beyond 'log-max-count' jobs
+    #  - the database still has head and tail of every stage log
+    def remove_logs(self, active):
+        if (self.config.get('log-max-age') == 0 and self.config.get('log-max-count') == 0):
+            return
+        active = [os.path.basename(dir) for dir in active]
+        max_age = time.time() - self.config.get('log-max-age') * 86400
+        logs = []
+        for entry in os.scandir(self.log_dir):
+            if (re.match(r'^\d\d\d\d\-\d\d\-\d\d_\d\d\d\d\d\d_\d+$', entry.name) is None or entry.is_dir(follow_symlinks = False) is False):
+                continue
+            if not (entry.name in active):
+                logs.append(entry)
+
+        # the name starts with the timestamp, the newest logs first
+        logs = sorted(logs, key = lambda e: e.name, reverse = True)
+        for number, entry in enumerate(logs):
+            if (self.config.get('log-max-count') > 0 and number >= self.config.get('log-max-count')):
+                logging.info("remove stage logs: " + entry.name + ", more than " + str(self.config.get('log-max-count')) + " jobs")
+            elif (self.config.get('log-max-age') > 0 and entry.stat(follow_symlinks = False).st_mtime < max_age):
+                logging.info("remove stage logs: " + entry.name)
+            else:
+                continue
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+
+    # free_space()
+    #
+    # return the free space in the build directory
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - free space in bytes
+    def free_space(self):
+        return shutil.disk_usage(self.build_dir).free
+
+
+
+    # retention()
+    #
+    # remove old builds
+    #
+    # parameter:
+    #  - self
+    #  - list with build directories which are in use
+    #  - additional space which is required, in bytes (optional)
+    # return:
+    #  none
+    # note:
+    #  - only the last 'keep-builds' builds of every branch are kept
+    #  - if the free space is below 'min-free-space' (plus the required
+    #    space), the least recently used builds are removed as well, until
+    #    there is enough space
+    #  - with 'cleanup-test-files', the kept builds lose their test files
+    #  - the stage logs expire after 'log-max-age' days, or 'log-max-count' jobs
+    def retention(self, active, needed = 0):
+        self.remove_logs(active)
+        builds = [b for b in self.builds() if not (b['path'] in active)]
+        if (self.config.get('cleanup-builds') is False):
+            if (self.config.get('cleanup-test-files') is True):
+                for build in builds:
+                    self.remove_test_files(build)
+            return
+
+        branches = {}
+        for build in builds:
+            branches.setdefault(build['branch'], []).append(build)
+
+        kept = []
+        removed = 0
+        for branch in branches:
+            # the name starts with the timestamp, the newest build first
+            ordered = sorted(branches[branch], key = lambda b: b['name'], reverse = True)
+            kept += ordered[:self.config.get('keep-builds')]
+            for build in ordered[self.config.get('keep-builds'):]:
+                logging.info("remove build: " + build['name'] + " (" + branch + ")")
+                self.remove(build['path'])
+                removed += 1
+
+        if (self.config.get('cleanup-test-files') is True):
+            for build in kept:
+                self.remove_test_files(build)
+
+        min_free = self.config.get('min-free-space') * 1024 * 1024 + needed
+        for build in sorted(kept, key = lambda b: b['used']):
+            free = self.free_space()
+            if (free >= min_free):
+                break
+            logging.info("remove build: " + build['name'] + ", only " + self.config.human_size(free) + " free space")
+            # the space has to be available before the next check
+            self.remove(build['path']).result()
+            removed += 1
+
+        # the worktrees of the removed builds are registered in the mirror
+        if (removed > 0):
+            self.repository.prune_worktrees()
+
+
+
+    # startup()
+    #
+    # cleanup old directories and patches, before the first job starts
+    #
+    # parameter:
+    #  - self
+    #  - list with build directories to keep (jobs resumed from the journal)
+    #  - list with patch files to keep (jobs resumed from the journal, optional)
+    # return:
+    #  none
+    # note:
+    #  - the removal continues in the background
+    def startup(self, keep, keep_files = None):
+        start_time = time.time()
+        self.empty_trash()
+
+        if (self.config.get('cleanup-repository') is True):
+            # cleanup all cached patches
+            for entry in os.scandir(self.cache_dir):
+                if (keep_files is not None and entry.path in keep_files):
+                    continue
+                if (re.match(r'^[a-f0-9]+\.(diff(\.unpacked|\.meta)?|patch)$', entry.name) and entry.is_file()):
+                    logging.info("remove patch: " + entry.name)
+                    os.remove(entry.path)
+
+        if (self.config.get('tmpfs-dir') is not False):
+            # test instances of jobs which did not finish
+            for entry in os.scandir(self.config.get('tmpfs-dir')):
+                if (re.match(r'^\d\d\d\d\-\d\d\-\d\d_\d\d\d\d\d\d_\d+$', entry.name) and entry.is_dir(follow_symlinks = False)):
+                    logging.info("remove test instances: " + entry.name)
+                    shutil.rmtree(entry.path, ignore_errors=True)
+
+        self.retention(keep)
+        logging.debug("cleanup started in " + str(round(time.time() - start_time, 1)) + "s")
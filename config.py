@@ -8,6 +8,7 @@ import yaml
 import logging
 import hashlib
 import string
+import shlex
 import atexit
 from lockfile import LockFile, LockTimeout
 from subprocess import Popen
@@ -169,6 +170,13 @@ class Config:
         self.pre_set_configfile_value('commitfest', 'secret', None)
         self.pre_set_configfile_value('commitfest', 'url', None)
         self.pre_set_configfile_value('commitfest', 'number-parallel-jobs', None)
+        self.pre_set_configfile_value('commitfest', 'number-io-jobs', None)
+
+        self.pre_set_configfile_value('scheduling', 'policy', None)
+        self.pre_set_configfile_value('scheduling', 'aging', None)
+        self.pre_set_configfile_value('scheduling', 'max-jobs-per-patch', None)
+        self.pre_set_configfile_value('scheduling', 'affinity', None)
+        self.pre_set_configfile_value('scheduling', 'steal-after', None)
 
         self.pre_set_configfile_value('repository', 'url', None)
 
@@ -177,17 +185,55 @@ class Config:
         self.pre_set_configfile_value('build', 'dirs', 'top-dir')
         self.pre_set_configfile_value('build', 'dirs', 'cache-dir')
         self.pre_set_configfile_value('build', 'dirs', 'build-dir')
+        self.pre_set_configfile_value('build', 'dirs', 'log-dir')
+        self.pre_set_configfile_value('build', 'dirs', 'tmpfs-dir')
+        self.pre_set_configfile_value('build', 'tmpfs-space', None)
 
         self.pre_set_configfile_value('build', 'options', None)
+        self.pre_set_configfile_value('build', 'snapshots', None)
+        self.pre_set_configfile_value('build', 'preflight', None)
+        self.pre_set_configfile_value('build', 'reuse-results', None)
 
         self.pre_set_configfile_value('build', 'cleanup', 'cleanup-builds')
         self.pre_set_configfile_value('build', 'cleanup', 'cleanup-repository')
         self.pre_set_configfile_value('build', 'cleanup', 'cleanup-test-files')
+        self.pre_set_configfile_value('build', 'cleanup', 'keep-builds')
+        self.pre_set_configfile_value('build', 'cleanup', 'min-free-space')
+        self.pre_set_configfile_value('build', 'cleanup', 'job-space')
+        self.pre_set_configfile_value('build', 'cleanup', 'log-max-age')
+        self.pre_set_configfile_value('build', 'cleanup', 'log-max-count')
 
         self.pre_set_configfile_value('locking', 'lockfile', None)
 
         self.pre_set_configfile_value('platform', 'linux', None)
 
+        self.pre_set_configfile_value('database', 'host', None)
+        self.pre_set_configfile_value('database', 'port', None)
+        self.pre_set_configfile_value('database', 'dbname', None)
+        self.pre_set_configfile_value('database', 'user', None)
+        self.pre_set_configfile_value('database', 'password', None)
+        self.pre_set_configfile_value('database', 'claim-timeout', None)
+        self.pre_set_configfile_value('database', 'poll-interval', None)
+        self.pre_set_configfile_value('database', 'pool-size', None)
+        self.pre_set_configfile_value('database', 'partitions-ahead', None)
+        self.pre_set_configfile_value('database', 'archive-after', None)
+
+        self.pre_set_configfile_value('git', 'fetch-interval', None)
+
+        self.pre_set_configfile_value('retest', 'enabled', None)
+        self.pre_set_configfile_value('retest', 'sweep-interval', None)
+        self.pre_set_configfile_value('retest', 'max-age', None)
+
+        self.pre_set_configfile_value('tests', 'mode', None)
+
+        self.pre_set_configfile_value('ccache', 'enabled', None)
+        self.pre_set_configfile_value('ccache', 'executable', None)
+        self.pre_set_configfile_value('ccache', 'max-size', None)
+
+        self.pre_set_configfile_value('patches', 'cache-max-size', None)
+        self.pre_set_configfile_value('patches', 'cache-max-age', None)
+        self.pre_set_configfile_value('patches', 'revalidate-interval', None)
+
 
         self.__configfile_read = 1
         return
@@ -291,6 +337,21 @@ class Config:
             ret['quiet'] = True
 
 
+        if (self.configfile is not False and len(self.configfile['build']['dirs']['top-dir']) > 0):
+            ret['top-dir'] = self.replace_home_env(self.configfile['build']['dirs']['top-dir'])
+        else:
+            self.print_help()
+            print("")
+            print("Error: top-dir is not defined")
+            sys.exit(1)
+        if (os.path.isdir(ret['top-dir']) is False):
+            self.print_help()
+            print("")
+            print("Error: top-dir is not a directory")
+            print("Argument: " + ret['top-dir'])
+            sys.exit(1)
+
+
         if (self.configfile is not False):
             if (len(self.configfile['build']['dirs']['cache-dir']) > 0 and os.path.isdir(self.replace_home_env(self.configfile['build']['dirs']['cache-dir'])) is False):
                 self.print_help()
@@ -335,6 +396,54 @@ class Config:
             sys.exit(1)
 
 
+        # the stage logs are kept after the build directory is removed
+        if (self.configfile is not False and len(self.configfile['build']['dirs']['log-dir']) > 0):
+            ret['log-dir'] = self.replace_home_env(self.configfile['build']['dirs']['log-dir'])
+        else:
+            ret['log-dir'] = os.path.join(ret['cache-dir'], 'logs')
+        if (os.path.isdir(ret['log-dir']) is False):
+            try:
+                os.makedirs(ret['log-dir'])
+            except OSError:
+                self.print_help()
+                print("")
+                print("Error: cannot create log-dir")
+                print("Argument: " + ret['log-dir'])
+                sys.exit(1)
+
+
+        # test instances on a RAM disk, disabled if empty
+        if (self.configfile is not False and len(str(self.configfile['build']['dirs']['tmpfs-dir'])) > 0):
+            ret['tmpfs-dir'] = self.replace_home_env(self.configfile['build']['dirs']['tmpfs-dir'])
+            if (os.path.isdir(ret['tmpfs-dir']) is False):
+                self.print_help()
+                print("")
+                print("Error: tmpfs-dir is not a directory")
+                print("Argument: " + ret['tmpfs-dir'])
+                sys.exit(1)
+        else:
+            ret['tmpfs-dir'] = False
+
+        # read value from configfile
+        if (self.configfile is not False and len(str(self.configfile['build']['tmpfs-space'])) > 0):
+            ret['tmpfs-space'] = self.configfile['build']['tmpfs-space']
+        else:
+            ret['tmpfs-space'] = 2048
+        try:
+            t = int(ret['tmpfs-space'])
+        except ValueError:
+            self.print_help()
+            print("")
+            print("Error: tmpfs-space is not an integer")
+            sys.exit(1)
+        if (t < 1):
+            self.print_help()
+            print("")
+            print("Error: tmpfs-space must be a positive integer")
+            sys.exit(1)
+        ret['tmpfs-space'] = t
+
+
         stat_cache = os.stat(ret['cache-dir'])
         stat_build = os.stat(ret['build-dir'])
         if (stat_cache.st_dev != stat_build.st_dev):
@@ -418,6 +527,56 @@ class Config:
         ret['git-depth'] = t
 
 
+        # read value from configfile
+        if (self.configfile is not False and len(str(self.configfile['git']['fetch-interval'])) > 0):
+            ret['git-fetch-interval'] = self.configfile['git']['fetch-interval']
+        else:
+            # default value: 5 minutes
+            ret['git-fetch-interval'] = 300
+        try:
+            t = int(ret['git-fetch-interval'])
+        except ValueError:
+            self.print_help()
+            print("")
+            print("Error: git fetch-interval is not an integer")
+            sys.exit(1)
+        if (t < 0):
+            self.print_help()
+            print("")
+            print("Error: git fetch-interval must be a positive integer")
+            sys.exit(1)
+        ret['git-fetch-interval'] = t
+
+
+        if (self.configfile is not False and self.configfile['retest']['enabled'] == 1):
+            ret['retest'] = True
+        else:
+            ret['retest'] = False
+
+        # sweep-interval: seconds between two re-tests of all recent patches
+        # max-age: only patches queued within this many days are re-tested
+        for name, default in [['sweep-interval', 86400],
+                              ['max-age', 30]]:
+            # read value from configfile
+            if (self.configfile is not False and len(str(self.configfile['retest'][name])) > 0):
+                ret['retest-' + name] = self.configfile['retest'][name]
+            else:
+                ret['retest-' + name] = default
+            try:
+                t = int(ret['retest-' + name])
+            except ValueError:
+                self.print_help()
+                print("")
+                print("Error: retest " + name + " is not an integer")
+                sys.exit(1)
+            if (t < 1):
+                self.print_help()
+                print("")
+                print("Error: retest " + name + " must be a positive integer")
+                sys.exit(1)
+            ret['retest-' + name] = t
+
+
         if (self.configfile is not False and len(self.configfile['commitfest']['username']) > 0):
             ret['commitfest-username'] = self.configfile['commitfest']['username']
         else:
@@ -445,7 +604,7 @@ class Config:
             sys.exit(1)
 
 
-        if (self.configfile is not False and len(self.configfile['commitfest']['number-parallel-jobs']) > 0):
+        if (self.configfile is not False and len(str(self.configfile['commitfest']['number-parallel-jobs'])) > 0):
             ret['number-parallel-jobs'] = self.configfile['commitfest']['number-parallel-jobs']
         else:
             self.print_help()
@@ -459,7 +618,7 @@ class Config:
             print("")
             print("Error: number-parallel-jobs is not an integer")
             sys.exit(1)
-        if (t < 0):
+        if (t < 1):
             self.print_help()
             print("")
             print("Error: number-parallel-jobs must be a positive integer")
@@ -467,6 +626,92 @@ class Config:
         ret['number-parallel-jobs'] = t
 
 
+        # read value from configfile
+        if (self.configfile is not False and len(str(self.configfile['commitfest']['number-io-jobs'])) > 0):
+            ret['number-io-jobs'] = self.configfile['commitfest']['number-io-jobs']
+        else:
+            # default value: as many jobs can prepare as can build
+            ret['number-io-jobs'] = ret['number-parallel-jobs']
+        try:
+            t = int(ret['number-io-jobs'])
+        except ValueError:
+            self.print_help()
+            print("")
+            print("Error: number-io-jobs is not an integer")
+            sys.exit(1)
+        if (t < 0):
+            self.print_help()
+            print("")
+            print("Error: number-io-jobs must be a positive integer")
+            sys.exit(1)
+        ret['number-io-jobs'] = t
+
+
+        # fifo: oldest job first
+        # sejf: shortest expected job first, based on the durations of earlier jobs
+        if (self.configfile is not False and len(str(self.configfile['scheduling']['policy'])) > 0):
+            ret['scheduling-policy'] = self.configfile['scheduling']['policy']
+        else:
+            ret['scheduling-policy'] = 'fifo'
+        if not (ret['scheduling-policy'] in ['fifo', 'sejf']):
+            self.print_help()
+            print("")
+            print("Error: scheduling policy must be one of 'fifo', 'sejf'")
+            print("Argument: " + ret['scheduling-policy'])
+            sys.exit(1)
+
+        # aging: seconds after which a waiting job is started like a short job
+        # max-jobs-per-patch: running jobs of the same patch, 0 is half of number-parallel-jobs
+        for name, default in [['aging', 21600],
+                              ['max-jobs-per-patch', 0]]:
+            # read value from configfile
+            if (self.configfile is not False and len(str(self.configfile['scheduling'][name])) > 0):
+                ret['scheduling-' + name] = self.configfile['scheduling'][name]
+            else:
+                ret['scheduling-' + name] = default
+            try:
+                t = int(ret['scheduling-' + name])
+            except ValueError:
+                self.print_help()
+                print("")
+                print("Error: scheduling " + name + " is not an integer")
+                sys.exit(1)
+            if (t < 0):
+                self.print_help()
+                print("")
+                print("Error: scheduling " + name + " must be a positive integer")
+                sys.exit(1)
+            ret['scheduling-' + name] = t
+        if (ret['scheduling-max-jobs-per-patch'] == 0):
+            ret['scheduling-max-jobs-per-patch'] = max(1, ret['number-parallel-jobs'] // 2)
+
+
+        if (self.configfile is not False and self.configfile['scheduling']['affinity'] == 1):
+            ret['affinity'] = True
+        else:
+            ret['affinity'] = False
+
+        # read value from configfile
+        if (self.configfile is not False and len(str(self.configfile['scheduling']['steal-after'])) > 0):
+            ret['affinity-steal-after'] = self.configfile['scheduling']['steal-after']
+        else:
+            # default value: 10 minutes
+            ret['affinity-steal-after'] = 600
+        try:
+            t = int(ret['affinity-steal-after'])
+        except ValueError:
+            self.print_help()
+            print("")
+            print("Error: scheduling steal-after is not an integer")
+            sys.exit(1)
+        if (t < 0):
+            self.print_help()
+            print("")
+            print("Error: scheduling steal-after must be a positive integer")
+            sys.exit(1)
+        ret['affinity-steal-after'] = t
+
+
         # do not really check if a valid repository is specified, let git deal with it
         if (self.configfile is not False and len(self.configfile['repository']['url'])) > 0:
             ret['repository-url'] = self.configfile['repository']['url']
@@ -477,6 +722,108 @@ class Config:
             sys.exit(1)
 
 
+        # a cache without space or time would remove every patch right away
+        for name, default, key, minimum in [['cache-max-size', 1024, 'patch-cache-max-size', 1],
+                                            ['cache-max-age', 30, 'patch-cache-max-age', 1],
+                                            ['revalidate-interval', 600, 'patch-revalidate-interval', 0]]:
+            # read value from configfile
+            if (self.configfile is not False and len(str(self.configfile['patches'][name])) > 0):
+                ret[key] = self.configfile['patches'][name]
+            else:
+                ret[key] = default
+            try:
+                t = int(ret[key])
+            except ValueError:
+                self.print_help()
+                print("")
+                print("Error: patches " + name + " is not an integer")
+                sys.exit(1)
+            if (t < minimum):
+                self.print_help()
+                print("")
+                print("Error: patches " + name + " must be at least " + str(minimum))
+                sys.exit(1)
+            ret[key] = t
+
+
+        # extra options for 'configure'
+        if (self.configfile is not False and len(str(self.configfile['build']['options'])) > 0):
+            ret['build-options'] = shlex.split(str(self.configfile['build']['options']))
+        else:
+            ret['build-options'] = []
+
+
+        if (self.configfile is not False and self.configfile['build']['snapshots'] == 1):
+            ret['build-snapshots'] = True
+        else:
+            ret['build-snapshots'] = False
+
+
+        if (self.configfile is not False and self.configfile['build']['preflight'] == 1):
+            ret['build-preflight'] = True
+        else:
+            ret['build-preflight'] = False
+
+
+        if (self.configfile is not False and self.configfile['build']['reuse-results'] == 1):
+            ret['build-reuse-results'] = True
+        else:
+            ret['build-reuse-results'] = False
+
+
+        # full: all tests, in parallel
+        # ordered: known suites one by one, likely failures first
+        # quick: like 'ordered', but stop at the first failure
+        # targeted: only the suites affected by the patch, and the core tests
+        if (self.configfile is not False and len(self.configfile['tests']['mode']) > 0):
+            ret['tests-mode'] = self.configfile['tests']['mode']
+        else:
+            ret['tests-mode'] = 'full'
+        if not (ret['tests-mode'] in ['full', 'ordered', 'quick', 'targeted']):
+            self.print_help()
+            print("")
+            print("Error: tests mode must be one of 'full', 'ordered', 'quick', 'targeted'")
+            print("Argument: " + ret['tests-mode'])
+            sys.exit(1)
+
+
+        if (self.configfile is not False and self.configfile['ccache']['enabled'] == 1):
+            ret['ccache'] = True
+        else:
+            ret['ccache'] = False
+
+        if (ret['ccache'] is True and len(self.configfile['ccache']['executable']) > 0):
+            # use the executable from the configuration file
+            if (self.binary_is_executable(self.configfile['ccache']['executable']) is False):
+                self.print_help()
+                print("")
+                print("Error: ccache executable is not an executable")
+                print("Argument: " + self.configfile['ccache']['executable'])
+                sys.exit(1)
+            ret['ccache-bin'] = self.configfile['ccache']['executable']
+        elif (ret['ccache'] is True):
+            # find ccache binary in $PATH
+            tmp_bin = self.find_in_path('ccache')
+            if (tmp_bin is False):
+                self.print_help()
+                print("")
+                print("Error: no 'ccache' executable found")
+                sys.exit(1)
+            ret['ccache-bin'] = tmp_bin
+
+        # size per branch, in ccache notation (e.g. 5G)
+        if (self.configfile is not False and len(str(self.configfile['ccache']['max-size'])) > 0):
+            ret['ccache-max-size'] = str(self.configfile['ccache']['max-size'])
+        else:
+            ret['ccache-max-size'] = '5G'
+        if (re.match(r'^\d+(\.\d+)?[kKMGT]?i?$', ret['ccache-max-size']) is None):
+            self.print_help()
+            print("")
+            print("Error: invalid ccache max-size")
+            print("Argument: " + ret['ccache-max-size'])
+            sys.exit(1)
+
+
         if (self.configfile is not False and self.configfile['build']['cleanup']['cleanup-builds'] == 1):
             ret['cleanup-builds'] = True
         else:
@@ -495,6 +842,153 @@ class Config:
             ret['cleanup-test-files'] = False
 
 
+        # keep-builds: finished builds which are kept per branch
+        # min-free-space: remove the oldest builds below this limit (MB)
+        # job-space: expected space of a job (MB), until a job was measured
+        # log-max-age: remove the stage logs of jobs after this many days, 0 keeps them
+        # log-max-count: keep the stage logs of this many jobs, 0 keeps all
+        for name, default in [['keep-builds', 2],
+                              ['min-free-space', 10240],
+                              ['job-space', 3072],
+                              ['log-max-age', 30],
+                              ['log-max-count', 0]]:
+            # read value from configfile
+            if (self.configfile is not False and len(str(self.configfile['build']['cleanup'][name])) > 0):
+                ret[name] = self.configfile['build']['cleanup'][name]
+            else:
+                ret[name] = default
+            try:
+                t = int(ret[name])
+            except ValueError:
+                self.print_help()
+                print("")
+                print("Error: cleanup " + name + " is not an integer")
+                sys.exit(1)
+            if (t < 0):
+                self.print_help()
+                print("")
+                print("Error: cleanup " + name + " must be a positive integer")
+                sys.exit(1)
+            ret[name] = t
+        # new jobs are admitted in units of this size
+        if (ret['job-space'] < 1):
+            self.print_help()
+            print("")
+            print("Error: cleanup job-space must be at least 1")
+            sys.exit(1)
+
+
+        # all platforms which are enabled for this host
+        ret['platforms'] = []
+        if (self.configfile is not False):
+            for name in sorted(self.configfile['platform'].keys()):
+                if (self.configfile['platform'][name] == 1):
+                    ret['platforms'].append(name)
+        if (len(ret['platforms']) == 0):
+            self.print_help()
+            print("")
+            print("Error: no platform enabled")
+            sys.exit(1)
+
+
+        # empty values are left to libpq (environment, defaults)
+        for name in ['host', 'port', 'dbname', 'user', 'password']:
+            ret['db-' + name.replace('dbname', 'name')] = self.configfile['database'][name]
+
+
+        # read value from configfile
+        if (self.configfile is not False and len(str(self.configfile['database']['claim-timeout'])) > 0):
+            ret['claim-timeout'] = self.configfile['database']['claim-timeout']
+        else:
+            # default value: 1 hour
+            ret['claim-timeout'] = 3600
+        try:
+            t = int(ret['claim-timeout'])
+        except ValueError:
+            self.print_help()
+            print("")
+            print("Error: claim-timeout is not an integer")
+            sys.exit(1)
+        if (t < 1):
+            self.print_help()
+            print("")
+            print("Error: claim-timeout must be a positive integer")
+            sys.exit(1)
+        ret['claim-timeout'] = t
+
+
+        # read value from configfile
+        if (self.configfile is not False and len(str(self.configfile['database']['poll-interval'])) > 0):
+            ret['poll-interval'] = self.configfile['database']['poll-interval']
+        else:
+            # default value: 5 minutes, new jobs are usually announced by notifications
+            ret['poll-interval'] = 300
+        try:
+            t = int(ret['poll-interval'])
+        except ValueError:
+            self.print_help()
+            print("")
+            print("Error: poll-interval is not an integer")
+            sys.exit(1)
+        if (t < 1):
+            self.print_help()
+            print("")
+            print("Error: poll-interval must be a positive integer")
+            sys.exit(1)
+        ret['poll-interval'] = t
+        # a claim has to survive a few polls, a slow poll must not requeue running jobs
+        if (ret['claim-timeout'] < 3 * ret['poll-interval']):
+            self.print_help()
+            print("")
+            print("Error: claim-timeout must be at least 3 times poll-interval")
+            sys.exit(1)
+
+
+        # read value from configfile
+        if (self.configfile is not False and len(str(self.configfile['database']['pool-size'])) > 0):
+            ret['db-pool-size'] = self.configfile['database']['pool-size']
+        else:
+            # default value: jobs only borrow connections for short updates
+            ret['db-pool-size'] = 2
+        try:
+            t = int(ret['db-pool-size'])
+        except ValueError:
+            self.print_help()
+            print("")
+            print("Error: pool-size is not an integer")
+            sys.exit(1)
+        if (t < 1):
+            self.print_help()
+            print("")
+            print("Error: pool-size must be a positive integer")
+            sys.exit(1)
+        ret['db-pool-size'] = t
+
+        # partitions-ahead: monthly partitions created in advance, at least the
+        #                   next month, results must never go into the default partition
+        # archive-after: months the stage logs stay in the database, 0 keeps them
+        for name, default, minimum in [['partitions-ahead', 2, 1],
+                                       ['archive-after', 12, 0]]:
+            # read value from configfile
+            if (self.configfile is not False and len(str(self.configfile['database'][name])) > 0):
+                ret[name] = self.configfile['database'][name]
+            else:
+                ret[name] = default
+            try:
+                t = int(ret[name])
+            except ValueError:
+                self.print_help()
+                print("")
+                print("Error: " + name + " is not an integer")
+                sys.exit(1)
+            if (t < minimum):
+                self.print_help()
+                print("")
+                print("Error: " + name + " must be at least " + str(minimum))
+                sys.exit(1)
+            ret[name] = t
+
+
         if (self.configfile is not False and len(self.replace_home_env(self.configfile['locking']['lockfile'])) > 0):
             ret['lockfile'] = self.replace_home_env(self.configfile['locking']['lockfile'])
         else:
@@ -712,57 +1206,3 @@ class Config:
                 return e
 
         return False
-
-
-
-    # cleanup_old_dirs_and_files()
-    #
-    # cleanup old directories, patches and build support files
-    #
-    # parameter:
-    #  - self
-    # return:
-    #  none
-    def cleanup_old_dirs_and_files(self):
-        print("FIXME: cleanup_old_dirs_and_files()")
-        sys.exit(1)
-        # note: not the best place for this function, but usually the Config module
-        # is initialized way before the other modules
-        if (self.get('cleanup-builds') is True):
-            # cleanup all directories in the 'build' and 'install' directory, which match a certain pattern
-            found = []
-            for entry in os.listdir(self.get('build-dir')):
-                if (os.path.isdir(os.path.join(self.get('build-dir'), entry))):
-                    found.append(os.path.join(self.get('build-dir'), entry))
-            for entry in os.listdir(self.get('install-dir')):
-                if (os.path.isdir(os.path.join(self.get('install-dir'), entry))):
-                    found.append(os.path.join(self.get('install-dir'), entry))
-
-            for entry in found:
-                entry_match = re.search(r'[\/\\]\d\d\d\d\-\d\d\-\d\d_\d\d\d\d\d\d_', entry)
-                if (entry_match):
-                    logging.info("remove directory: " + str(entry))
-                    shutil.rmtree(entry, ignore_errors=True)
-                    if (os.path.isfile(entry + '.diff')):
-                        logging.info("remove patch: " + str(entry) + '.diff')
-                        os.remove(entry + '.diff')
-
-        if (self.get('cleanup-repository') is True):
-            # cleanup all files in the 'cache' directory, which match a certain pattern
-            found = []
-            for entry in os.listdir(self.get('cache-dir')):
-                if (os.path.isfile(os.path.join(self.get('cache-dir'), entry))):
-                    found.append(os.path.join(self.get('cache-dir'), entry))
-
-            for entry in found:
-                entry_match = re.search(r'[\/\\][a-f0-9]+\.diff$', entry)
-                if (entry_match):
-                    logging.info("remove patch: " + str(entry))
-                    os.remove(entry)
-                entry_match = re.search(r'[\/\\][a-f0-9]+\.diff.unpacked$', entry)
-                if (entry_match):
-                    logging.info("remove patch: " + str(entry))
-                    os.remove(entry)
-
-
-
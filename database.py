@@ -0,0 +1,973 @@
+import time
+import select
+import contextlib
+import logging
+import socket
+import threading
+import psycopg2
+import psycopg2.extras
+import psycopg2.extensions
+import psycopg2.pool
+
+
+class Database:
+
+    def __init__(self, config):
+        self.config = config
+        # identifies this test host in the job queue
+        self.worker_name = socket.gethostname()
+        self.pool = None
+        self.lock = threading.Lock()
+        # the pool raises an error when exhausted, jobs wait here instead
+        self.pool_slots = threading.Semaphore(config.get('db-pool-size'))
+        # fired by a trigger when new jobs are queued
+        self.notify_channel = 'commitfest_test_patch'
+        # all patches of a job, in the order they are applied
+        self.patches_query = """
+          COALESCE((SELECT json_agg(json_build_object('patch_location', cp.patch_location,
+                                                      'patch_type', pt.name,
+                                                      'repo_url', cp.repo_url)
+                                    ORDER BY cp.id DESC)
+                      FROM "public"."commitfest_patch" cp
+                      JOIN "public"."commitfest_patch_type" pt
+                        ON pt.id = cp.patch_type
+                     WHERE cp.patch = tp.id), '[]') AS patches"""
+        # the warm caches of this host, for the branch of a queued job
+        self.affinity_join = """
+            JOIN "public"."commitfest_test_pg_versions" v
+              ON v.id = tp.pg_version
+       LEFT JOIN "public"."commitfest_test_host_caches" mine
+              ON mine.host = %(worker)s
+             AND mine.branch_name_prefix = v.branch_name_prefix"""
+        # leave the job to another host with a warm cache for the branch and
+        # a free slot, unless this host is idle, or the job waited too long
+        self.affinity_filter = """
+             AND (%(affinity)s IS FALSE
+                  OR %(idle)s IS TRUE
+                  OR COALESCE(mine.snapshot, FALSE) IS TRUE
+                  OR tp.ts_added < NOW() - %(steal_after)s * INTERVAL '1 second'
+                  OR NOT EXISTS (SELECT 1
+                                   FROM "public"."commitfest_test_host_caches" hc
+                                   JOIN "public"."commitfest_test_hosts" h
+                                     ON h.name = hc.host
+                                  WHERE hc.branch_name_prefix = v.branch_name_prefix
+                                    AND hc.host <> %(worker)s
+                                    AND hc.snapshot IS TRUE
+                                    AND h.free_slots > 0
+                                    AND h.ts_heartbeat > NOW() - %(host_timeout)s * INTERVAL '1 second'))"""
+        self.affinity_order = "COALESCE(mine.snapshot, FALSE) DESC, COALESCE(mine.ccache, FALSE) DESC"
+
+
+
+    # connection_args()
+    #
+    # build the connection parameters from the configuration
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - dictionary with connection parameters
+    # note:
+    #  - empty values are left to libpq (environment, defaults)
+    def connection_args(self):
+        args = {}
+        for name, key in [['host', 'db-host'], ['port', 'db-port'], ['dbname', 'db-name'],
+                          ['user', 'db-user'], ['password', 'db-password']]:
+            if (len(str(self.config.get(key))) > 0):
+                args[name] = self.config.get(key)
+
+        return args
+
+
+
+    # connect()
+    #
+    # create the connection pool, if not already done
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - connection pool
+    # note:
+    #  - connections are opened on demand, at most 'db-pool-size'
+    def connect(self):
+        with self.lock:
+            if (self.pool is None):
+                logging.debug("connecting to database " + str(self.config.get('db-name')) + ", pool size " + str(self.config.get('db-pool-size')))
+                self.pool = psycopg2.pool.ThreadedConnectionPool(0, self.config.get('db-pool-size'), **self.connection_args())
+
+        return self.pool
+
+
+
+    # connection()
+    #
+    # borrow a connection from the pool, and run a transaction
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - connection (context manager)
+    # note:
+    #  - the transaction is committed at the end of the block, or rolled
+    #    back on errors, the connection goes back into the pool
+    #  - waits until a connection is available
+    #  - keep the block short, never hold a connection during a build
+    @contextlib.contextmanager
+    def connection(self):
+        pool = self.connect()
+        self.pool_slots.acquire()
+        conn = None
+        broken = False
+        try:
+            conn = pool.getconn()
+            with conn:
+                yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # the connection is broken, don't return it into the pool
+            broken = True
+            raise
+        finally:
+            if (conn is not None):
+                pool.putconn(conn, close = broken)
+            self.pool_slots.release()
+
+
+
+    # cursor()
+    #
+    # borrow a connection from the pool, and run a transaction
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - cursor (context manager)
+    # note:
+    #  - see connection()
+    @contextlib.contextmanager
+    def cursor(self):
+        with self.connection() as conn:
+            with conn.cursor(cursor_factory = psycopg2.extras.RealDictCursor) as cur:
+                yield cur
+
+
+
+    # execute()
+    #
+    # run a query in a single transaction
+    #
+    # parameter:
+    #  - self
+    #  - query
+    #  - query parameters
+    # return:
+    #  - list with all result rows (as dictionaries), or [] if the query returns no rows
+    def execute(self, query, parameters = None):
+        with self.cursor() as cur:
+            cur.execute(query, parameters)
+            if (cur.description is None):
+                return []
+            return cur.fetchall()
+
+
+
+    # claim_jobs()
+    #
+    # claim queued jobs for this host
+    #
+    # parameter:
+    #  - self
+    #  - maximum number of jobs
+    #  - True if only jobs without apply check are claimed (optional)
+    #  - list with job ids, chosen by the scheduling policy (optional)
+    #  - True if this host runs no jobs (optional)
+    # return:
+    #  - list with jobs
+    # note:
+    #  - locked rows are skipped, other hosts claiming at the same time
+    #    neither wait for each other nor get the same job
+    #  - the patches are returned with the job, in one round trip
+    #  - jobs for branches with a warm cache on this host come first
+    #  - with 'build-preflight', regular jobs are only claimed after the
+    #    apply check
+    def claim_jobs(self, number, preflight = False, job_ids = None, idle = False):
+        if (number < 1 or len(self.config.get('platforms')) == 0):
+            return []
+
+        query = """
+   WITH claimable AS (
+          SELECT tp.id
+            FROM "public"."commitfest_test_patch" tp
+            JOIN "public"."commitfest_test_platforms" p
+              ON p.id = tp.platform""" + self.affinity_join + """
+           WHERE tp.state = 'queued'
+             AND tp.ts_started IS NULL
+             AND p.name = ANY(%(platforms)s)
+             AND (%(preflight)s IS FALSE OR tp.apply_checked IS FALSE)
+             -- with the apply check, regular jobs only run after the check
+             AND (%(checked)s IS FALSE OR tp.apply_checked IS TRUE)
+             AND (%(ids)s::BIGINT[] IS NULL OR tp.id = ANY(%(ids)s::BIGINT[]))
+             -- the patches might be inserted in a later transaction
+             AND EXISTS (SELECT 1
+                           FROM "public"."commitfest_patch" cp
+                          WHERE cp.patch = tp.id)""" + self.affinity_filter + """
+        ORDER BY tp.priority DESC, """ + self.affinity_order + """, tp.ts_added, tp.id
+           LIMIT %(number)s
+             FOR UPDATE OF tp SKIP LOCKED
+        )
+ UPDATE "public"."commitfest_test_patch" tp
+    SET ts_started = NOW(),
+        ts_heartbeat = NOW(),
+        claimed_by = %(worker)s
+   FROM claimable c,
+        "public"."commitfest_test_pg_versions" v,
+        "public"."commitfest_test_platforms" p
+  WHERE tp.id = c.id
+    AND v.id = tp.pg_version
+    AND p.id = tp.platform
+RETURNING tp.id, tp.name, tp.pg_version, tp.platform, tp.ts_added, tp.ts_started, tp.apply_checked,
+          v.branch_name_prefix, p.name AS platform_name,""" + self.patches_query
+        parameters = self.affinity_parameters(idle)
+        # the apply check is cheap on every host
+        if (preflight is True):
+            parameters['affinity'] = False
+        parameters.update({'platforms': self.config.get('platforms'),
+                           'preflight': preflight,
+                           'checked': preflight is False and self.config.get('build-preflight') is True,
+                           'ids': job_ids,
+                           'number': number})
+        rows = self.execute(query, parameters)
+        jobs = [dict(row) for row in rows]
+        for job in jobs:
+            logging.info("claimed job " + str(job['id']) + ": " + job['branch_name_prefix'] + " on " + job['platform_name'] + " (" + str(len(job['patches'])) + " patches)")
+
+        return jobs
+
+
+
+    # affinity_parameters()
+    #
+    # return the query parameters for the cache affinity
+    #
+    # parameter:
+    #  - self
+    #  - True if this host runs no jobs
+    # return:
+    #  - dictionary with parameters
+    def affinity_parameters(self, idle):
+        return {'worker': self.worker_name,
+                'affinity': self.config.get('affinity'),
+                'idle': idle,
+                'steal_after': self.config.get('affinity-steal-after'),
+                # a host which missed two polls is gone
+                'host_timeout': 2 * self.config.get('poll-interval')}
+
+
+
+    # advertise_caches()
+    #
+    # tell the other test hosts which caches are warm on this host
+    #
+    # parameter:
+    #  - self
+    #  - number of free job slots
+    #  - list with dictionaries: 'branch_name_prefix', 'revision', 'snapshot', 'ccache'
+    # return:
+    #  none
+    def advertise_caches(self, free_slots, caches):
+        with self.cursor() as cur:
+            cur.execute("""
+INSERT INTO "public"."commitfest_test_hosts"
+            (name, ts_heartbeat, free_slots)
+     VALUES (%(worker)s, NOW(), %(free_slots)s)
+ON CONFLICT (name)
+  DO UPDATE
+        SET ts_heartbeat = NOW(),
+            free_slots = EXCLUDED.free_slots""", {'worker': self.worker_name, 'free_slots': free_slots})
+            cur.execute("""
+DELETE FROM "public"."commitfest_test_host_caches"
+      WHERE host = %(worker)s""", {'worker': self.worker_name})
+            for cache in caches:
+                cur.execute("""
+INSERT INTO "public"."commitfest_test_host_caches"
+            (host, branch_name_prefix, revision, snapshot, ccache)
+     VALUES (%(worker)s, %(branch_name_prefix)s, %(revision)s, %(snapshot)s, %(ccache)s)""", dict(cache, worker = self.worker_name))
+
+
+
+    # start_listener()
+    #
+    # listen for new jobs in a background thread
+    #
+    # parameter:
+    #  - self
+    #  - function which is called for every notification
+    # return:
+    #  none
+    def start_listener(self, callback):
+        thread = threading.Thread(target = self.listener, args = (callback,), name = 'listener')
+        thread.daemon = True
+        thread.start()
+
+
+
+    # listener()
+    #
+    # wait for notifications about new jobs, and call the callback
+    #
+    # parameter:
+    #  - self
+    #  - function which is called for every notification
+    # return:
+    #  none
+    # note:
+    #  - uses a separate connection, which is idle most of the time
+    #  - reconnects if the connection is lost, the scheduler falls back
+    #    to polling in the meantime
+    def listener(self, callback):
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(**self.connection_args())
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute('LISTEN "' + self.notify_channel + '"')
+                logging.debug("listening on channel " + self.notify_channel)
+                # jobs might have been queued while not listening
+                callback()
+
+                while True:
+                    if (select.select([conn], [], [], 300) == ([], [], [])):
+                        continue
+                    conn.poll()
+                    if (len(conn.notifies) > 0):
+                        # several notifications are handled by a single lookup
+                        del conn.notifies[:]
+                        callback()
+            except (psycopg2.Error, OSError, select.error) as e:
+                logging.warning("listener connection lost: " + str(e).strip())
+                if (conn is not None):
+                    conn.close()
+                time.sleep(30)
+
+
+
+    # heartbeat()
+    #
+    # mark the running jobs of this host as alive
+    #
+    # parameter:
+    #  - self
+    #  - list with job ids
+    # return:
+    #  - list with the ids of the jobs which are still claimed by this host
+    def heartbeat(self, job_ids):
+        if (len(job_ids) == 0):
+            return []
+        rows = self.execute("""
+UPDATE "public"."commitfest_test_patch"
+   SET ts_heartbeat = NOW()
+ WHERE id = ANY(%(ids)s)
+   AND claimed_by = %(worker)s
+   AND ts_finished IS NULL
+RETURNING id""", {'ids': list(job_ids), 'worker': self.worker_name})
+
+        return [row['id'] for row in rows]
+
+
+
+    # expire_claims()
+    #
+    # return stale jobs into the queue
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - number of requeued jobs
+    # note:
+    #  - a claim is stale if the host did not send a heartbeat for
+    #    'claim-timeout' seconds, usually the host died
+    def expire_claims(self):
+        rows = self.execute("""
+UPDATE "public"."commitfest_test_patch"
+   SET ts_started = NULL,
+       ts_heartbeat = NULL,
+       claimed_by = NULL
+ WHERE state = 'queued'
+   AND ts_finished IS NULL
+   AND ts_started IS NOT NULL
+   AND COALESCE(ts_heartbeat, ts_started) < NOW() - %(timeout)s * INTERVAL '1 second'
+RETURNING id""", {'timeout': self.config.get('claim-timeout')})
+        for row in rows:
+            logging.warning("requeued stale job " + str(row['id']))
+
+        return len(rows)
+
+
+
+    # release_claims()
+    #
+    # return jobs of this host into the queue
+    #
+    # parameter:
+    #  - self
+    #  - list with job ids, or None for all jobs of this host
+    #  - list with job ids which stay claimed (optional)
+    # return:
+    #  - number of released jobs
+    # note:
+    #  - used on startup, jobs from a previous run are no longer running,
+    #    unless they resume from the journal
+    def release_claims(self, job_ids = None, keep = None):
+        query = """
+UPDATE "public"."commitfest_test_patch"
+   SET ts_started = NULL,
+       ts_heartbeat = NULL,
+       claimed_by = NULL
+ WHERE state = 'queued'
+   AND ts_finished IS NULL
+   AND claimed_by = %(worker)s"""
+        if (job_ids is not None):
+            query += """
+   AND id = ANY(%(ids)s)"""
+            job_ids = list(job_ids)
+        if (keep is not None and len(keep) > 0):
+            query += """
+   AND NOT (id = ANY(%(keep)s))"""
+            keep = list(keep)
+        query += """
+RETURNING id"""
+        rows = self.execute(query, {'worker': self.worker_name, 'ids': job_ids, 'keep': keep})
+        for row in rows:
+            logging.info("released job " + str(row['id']))
+
+        return len(rows)
+
+
+
+    # mark_apply_checked()
+    #
+    # return jobs into the queue, after the patches passed the apply check
+    #
+    # parameter:
+    #  - self
+    #  - list with job ids
+    # return:
+    #  none
+    def mark_apply_checked(self, job_ids):
+        if (len(job_ids) == 0):
+            return
+        self.execute("""
+UPDATE "public"."commitfest_test_patch"
+   SET apply_checked = TRUE,
+       ts_started = NULL,
+       ts_heartbeat = NULL,
+       claimed_by = NULL
+ WHERE id = ANY(%(ids)s)
+   AND claimed_by = %(worker)s
+   AND ts_finished IS NULL""", {'ids': list(job_ids), 'worker': self.worker_name})
+
+
+
+    # set_git_revision()
+    #
+    # store the revision used for a job
+    #
+    # parameter:
+    #  - self
+    #  - job id
+    #  - revision
+    # return:
+    #  none
+    def set_git_revision(self, job_id, revision):
+        self.execute("""
+UPDATE "public"."commitfest_test_patch"
+   SET git_revision = %(revision)s
+ WHERE id = %(id)s""", {'id': job_id, 'revision': revision})
+
+
+
+    # set_patch_size()
+    #
+    # store the size of the patches of a job
+    #
+    # parameter:
+    #  - self
+    #  - job id
+    #  - size in bytes
+    # return:
+    #  none
+    def set_patch_size(self, job_id, size):
+        self.execute("""
+UPDATE "public"."commitfest_test_patch"
+   SET patch_size = %(size)s
+ WHERE id = %(id)s""", {'id': job_id, 'size': size})
+
+
+
+    # queued_jobs()
+    #
+    # return the first queued jobs, as candidates for the scheduling policy
+    #
+    # parameter:
+    #  - self
+    #  - maximum number of jobs
+    #  - True if this host runs no jobs (optional)
+    # return:
+    #  - list with 'id', 'pg_version', 'platform', 'priority', 'patch_size',
+    #    'waiting' (seconds), 'locations' (identifies the patch set) and
+    #    'running' (started jobs of the same patch set, on all hosts)
+    def queued_jobs(self, number, idle = False):
+        if (number < 1 or len(self.config.get('platforms')) == 0):
+            return []
+
+        return self.execute("""
+   WITH queued AS (
+          SELECT tp.id, tp.pg_version, tp.platform, tp.priority, tp.patch_size,
+                 EXTRACT(EPOCH FROM NOW() - tp.ts_added) AS waiting,
+                 (SELECT string_agg(cp.patch_location, ' ' ORDER BY cp.id)
+                    FROM "public"."commitfest_patch" cp
+                   WHERE cp.patch = tp.id) AS locations
+            FROM "public"."commitfest_test_patch" tp
+            JOIN "public"."commitfest_test_platforms" p
+              ON p.id = tp.platform""" + self.affinity_join + """
+           WHERE tp.state = 'queued'
+             AND tp.ts_started IS NULL
+             AND p.name = ANY(%(platforms)s)
+             AND (%(checked)s IS FALSE OR tp.apply_checked IS TRUE)""" + self.affinity_filter + """
+        ORDER BY tp.priority DESC, """ + self.affinity_order + """, tp.ts_added, tp.id
+           LIMIT %(number)s
+        ),
+        running AS (
+          SELECT (SELECT string_agg(cp.patch_location, ' ' ORDER BY cp.id)
+                    FROM "public"."commitfest_patch" cp
+                   WHERE cp.patch = tp.id) AS locations
+            FROM "public"."commitfest_test_patch" tp
+           WHERE tp.state = 'queued'
+             AND tp.ts_started IS NOT NULL
+             AND tp.ts_finished IS NULL
+        )
+ SELECT q.*,
+        (SELECT COUNT(*) FROM running r WHERE r.locations = q.locations) AS running
+   FROM queued q
+  WHERE q.locations IS NOT NULL""", dict(self.affinity_parameters(idle), platforms = self.config.get('platforms'), number = number,
+                                        checked = self.config.get('build-preflight')))
+
+
+
+    # duration_history()
+    #
+    # return the average duration of earlier jobs
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - list with 'pg_version', 'platform', 'size_class', 'duration' (seconds), 'jobs'
+    # note:
+    #  - the size class is the binary logarithm of the patch size in KB
+    #  - reused results did not take any time, and are ignored
+    #  - jobs which stopped before 'configure' (patch does not apply, also the
+    #    pre-flight check) say nothing about the build time, and are ignored
+    def duration_history(self):
+        return self.execute("""
+  SELECT tp.pg_version, tp.platform,
+         CASE WHEN tp.patch_size IS NULL THEN NULL
+              ELSE FLOOR(LOG(2, GREATEST(tp.patch_size, 1024) / 1024.0))::INTEGER
+          END AS size_class,
+         AVG(r.time_git_update + COALESCE(r.time_prepare_source, 0) + r.time_configure + r.time_make + r.time_install + r.time_tests) AS duration,
+         COUNT(*) AS jobs
+    FROM "public"."commitfest_test_results" r
+    JOIN "public"."commitfest_test_patch" tp
+      ON tp.id = r.test_id
+   WHERE r.start_time > NOW() - INTERVAL '30 days'
+     AND r.reused_from IS NULL
+     AND r.run_configure IS TRUE
+     AND tp.state IN ('success', 'failed')
+GROUP BY 1, 2, 3""")
+
+
+
+    # store_result()
+    #
+    # store the result and the stage logs of a job
+    #
+    # parameter:
+    #  - self
+    #  - job
+    # return:
+    #  - id of the result
+    # note:
+    #  - the stage logs only contain head and tail of the output, the full
+    #    logs stay compressed on the test host, see 'log_location'
+    def store_result(self, job):
+        result = {
+            'test_id': job['id'],
+            'repository': self.config.get('repository-url'),
+            'revision': job.get('git_revision') or '',
+            'branch': job.get('branch') or job['branch_name_prefix'],
+            # the top of the branch is always tested
+            'is_head': True,
+            'start_time': job['start_time'],
+            'end_time': job['end_time'],
+            'patches': "\n".join([p['patch_location'] for p in job['patches']]),
+            'errorstr': job.get('errorstr', ''),
+            'log_location': self.worker_name + ':' + job['log-dir'],
+            'result_key': job.get('result_key'),
+        }
+        for stage in ['configure', 'make', 'install', 'tests']:
+            result['run_' + stage] = job.get('run_' + stage, False)
+        for stage in ['git_update', 'configure', 'make', 'install', 'tests']:
+            result['time_' + stage] = job.get('time_' + stage, 0.0)
+        result['time_prepare_source'] = job.get('time_prepare_source')
+        for stage in ['git_update', 'patch', 'configure', 'make', 'install', 'tests']:
+            result['result_' + stage] = job.get('result_' + stage)
+            if (stage in job['logs']):
+                result['stage_' + stage] = job['logs'][stage].excerpt()
+            else:
+                # stages which finished before the job was resumed
+                result['stage_' + stage] = job.get('stage-excerpts', {}).get(stage, '')
+        for name in ['pg_version', 'pg_version_num', 'pg_version_str', 'ccache_hits', 'ccache_misses']:
+            result[name] = job.get(name)
+        result['test_timings'] = None
+        if ('test_timings' in job):
+            result['test_timings'] = psycopg2.extras.Json(job['test_timings'])
+
+        with self.cursor() as cur:
+            cur.execute("""
+INSERT INTO "public"."commitfest_test_results"
+            (test_id, repository, revision, branch, is_head, start_time, end_time,
+             run_configure, run_make, run_install, run_tests,
+             time_git_update, time_prepare_source, time_configure, time_make, time_install, time_tests,
+             result_git_update, result_patch, result_configure, result_make, result_install, result_tests,
+             pg_version, pg_version_num, pg_version_str, ccache_hits, ccache_misses, test_timings, result_key)
+     VALUES (%(test_id)s, %(repository)s, %(revision)s, %(branch)s, %(is_head)s, %(start_time)s, %(end_time)s,
+             %(run_configure)s, %(run_make)s, %(run_install)s, %(run_tests)s,
+             %(time_git_update)s, %(time_prepare_source)s, %(time_configure)s, %(time_make)s, %(time_install)s, %(time_tests)s,
+             %(result_git_update)s, %(result_patch)s, %(result_configure)s, %(result_make)s, %(result_install)s, %(result_tests)s,
+             %(pg_version)s, %(pg_version_num)s, %(pg_version_str)s, %(ccache_hits)s, %(ccache_misses)s, %(test_timings)s, %(result_key)s)
+  RETURNING id""", result)
+            result['result_id'] = cur.fetchone()['id']
+            cur.execute("""
+INSERT INTO "public"."commitfest_test_data"
+            (test_id, start_time, patches, errorstr, log_location,
+             stage_git_update, stage_patch, stage_configure, stage_make, stage_install, stage_tests)
+     VALUES (%(result_id)s, %(start_time)s, %(patches)s, %(errorstr)s, %(log_location)s,
+             %(stage_git_update)s, %(stage_patch)s, %(stage_configure)s, %(stage_make)s, %(stage_install)s, %(stage_tests)s)""", result)
+
+        return result['result_id']
+
+
+
+    # retest_versions()
+    #
+    # return all active branches, with the state of the re-tests
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - list with 'id', 'branch_name_prefix', 'retest_revision', 'sweep_due'
+    def retest_versions(self):
+        return self.execute("""
+SELECT id, branch_name_prefix, retest_revision,
+       (ts_retest_sweep IS NULL OR ts_retest_sweep < NOW() - %(interval)s * INTERVAL '1 second') AS sweep_due
+  FROM "public"."commitfest_test_pg_versions"
+ WHERE active = TRUE""", {'interval': self.config.get('retest-sweep-interval')})
+
+
+
+    # advance_retest_revision()
+    #
+    # move the re-test revision of a branch forward
+    #
+    # parameter:
+    #  - self
+    #  - version id
+    #  - old revision
+    #  - new revision
+    # return:
+    #  - True if this host moved the revision, and has to queue the re-tests
+    # note:
+    #  - with multiple test hosts only one of them wins
+    def advance_retest_revision(self, version_id, old_revision, new_revision):
+        rows = self.execute("""
+UPDATE "public"."commitfest_test_pg_versions"
+   SET retest_revision = %(new)s
+ WHERE id = %(id)s
+   AND retest_revision = %(old)s
+RETURNING id""", {'id': version_id, 'old': old_revision, 'new': new_revision})
+
+        return len(rows) > 0
+
+
+
+    # start_retest_sweep()
+    #
+    # mark the periodic re-test of a branch as done
+    #
+    # parameter:
+    #  - self
+    #  - version id
+    # return:
+    #  - True if this host has to queue the re-tests
+    def start_retest_sweep(self, version_id):
+        rows = self.execute("""
+UPDATE "public"."commitfest_test_pg_versions"
+   SET ts_retest_sweep = NOW()
+ WHERE id = %(id)s
+   AND (ts_retest_sweep IS NULL OR ts_retest_sweep < NOW() - %(interval)s * INTERVAL '1 second')
+RETURNING id""", {'id': version_id, 'interval': self.config.get('retest-sweep-interval')})
+
+        return len(rows) > 0
+
+
+
+    # recent_tests()
+    #
+    # return the last finished test of every recent patch set of a branch
+    #
+    # parameter:
+    #  - self
+    #  - version id
+    # return:
+    #  - list with 'id' and 'patches'
+    # note:
+    #  - a patch set is identified by the locations of all patches, and
+    #    the platform
+    #  - patch sets which are queued already are skipped
+    #  - the age counts from the first test of the patch set, re-tests
+    #    do not keep a patch set alive
+    def recent_tests(self, version_id):
+        rows = self.execute("""
+   WITH tests AS (
+          SELECT tp.id, tp.platform, tp.state, tp.ts_added,
+                 (SELECT string_agg(cp.patch_location, ' ' ORDER BY cp.id)
+                    FROM "public"."commitfest_patch" cp
+                   WHERE cp.patch = tp.id) AS locations
+            FROM "public"."commitfest_test_patch" tp
+           WHERE tp.pg_version = %(version)s
+        ),
+        latest AS (
+          SELECT DISTINCT ON (platform, locations) id, state,
+                 MIN(ts_added) OVER (PARTITION BY platform, locations) AS first_added
+            FROM tests
+           WHERE locations IS NOT NULL
+        ORDER BY platform, locations, id DESC
+        )
+ SELECT tp.id,""" + self.patches_query + """
+   FROM latest
+   JOIN "public"."commitfest_test_patch" tp
+     ON tp.id = latest.id
+  WHERE latest.state <> 'queued'
+    AND latest.first_added > NOW() - %(days)s * INTERVAL '1 day'""", {'version': version_id, 'days': self.config.get('retest-max-age')})
+
+        return [dict(row) for row in rows]
+
+
+
+    # requeue_tests()
+    #
+    # queue a test again
+    #
+    # parameter:
+    #  - self
+    #  - list with test ids
+    #  - priority
+    # return:
+    #  - number of queued tests
+    def requeue_tests(self, test_ids, priority):
+        if (len(test_ids) == 0):
+            return 0
+        with self.cursor() as cur:
+            for test_id in test_ids:
+                cur.execute("""
+INSERT INTO "public"."commitfest_test_patch"
+            (pg_version, platform, name, priority)
+     SELECT pg_version, platform, name, %(priority)s
+       FROM "public"."commitfest_test_patch"
+      WHERE id = %(id)s
+  RETURNING id""", {'id': test_id, 'priority': priority})
+                new_id = cur.fetchone()['id']
+                cur.execute("""
+INSERT INTO "public"."commitfest_patch"
+            (patch, patch_location, patch_type, repo_url)
+     SELECT %(new_id)s, patch_location, patch_type, repo_url
+       FROM "public"."commitfest_patch"
+      WHERE patch = %(id)s
+   ORDER BY id""", {'id': test_id, 'new_id': new_id})
+
+        return len(test_ids)
+
+
+
+    # find_result()
+    #
+    # find the result of an identical test
+    #
+    # parameter:
+    #  - self
+    #  - result key
+    # return:
+    #  - dictionary with result id and job state, or None
+    # note:
+    #  - failed tests are not reused, the tests might be unstable, failures
+    #    in earlier stages are
+    def find_result(self, result_key):
+        rows = self.execute("""
+  SELECT r.id, tp.state
+    FROM "public"."commitfest_test_results" r
+    JOIN "public"."commitfest_test_patch" tp
+      ON tp.id = r.test_id
+   WHERE r.result_key = %(key)s
+     AND (tp.state = 'success'
+          OR (tp.state = 'failed' AND COALESCE(r.result_tests, 0) = 0))
+ORDER BY r.id DESC
+   LIMIT 1""", {'key': result_key})
+        if (len(rows) == 0):
+            return None
+
+        return dict(rows[0])
+
+
+
+    # copy_result()
+    #
+    # store the result of an identical test for a job
+    #
+    # parameter:
+    #  - self
+    #  - job id
+    #  - result id of the identical test
+    # return:
+    #  - new result id
+    # note:
+    #  - 'reused_from' always points to the test which actually ran
+    #  - the copy keeps the start time of the original test, and goes into
+    #    the same partition, the stage logs of archived tests are gone
+    def copy_result(self, job_id, result_id):
+        with self.cursor() as cur:
+            cur.execute("""
+INSERT INTO "public"."commitfest_test_results"
+            (test_id, repository, revision, branch, is_head, start_time, end_time,
+             run_configure, run_make, run_install, run_tests,
+             time_git_update, time_prepare_source, time_configure, time_make, time_install, time_tests,
+             result_git_update, result_patch, result_configure, result_make, result_install, result_tests,
+             pg_version, pg_version_num, pg_version_str, ccache_hits, ccache_misses, test_timings,
+             result_key, reused_from)
+     SELECT %(job_id)s, repository, revision, branch, is_head, start_time, end_time,
+            run_configure, run_make, run_install, run_tests,
+            time_git_update, time_prepare_source, time_configure, time_make, time_install, time_tests,
+            result_git_update, result_patch, result_configure, result_make, result_install, result_tests,
+            pg_version, pg_version_num, pg_version_str, ccache_hits, ccache_misses, test_timings,
+            result_key, COALESCE(reused_from, id)
+       FROM "public"."commitfest_test_results"
+      WHERE id = %(result_id)s
+  RETURNING id""", {'job_id': job_id, 'result_id': result_id})
+            new_id = cur.fetchone()['id']
+            cur.execute("""
+INSERT INTO "public"."commitfest_test_data"
+            (test_id, start_time, patches, errorstr, log_location,
+             stage_git_update, stage_patch, stage_configure, stage_make, stage_install, stage_tests)
+     SELECT %(new_id)s, start_time, patches, errorstr, log_location,
+            stage_git_update, stage_patch, stage_configure, stage_make, stage_install, stage_tests
+       FROM "public"."commitfest_test_data"
+      WHERE test_id = %(result_id)s""", {'new_id': new_id, 'result_id': result_id})
+
+        return new_id
+
+
+
+    # create_partitions()
+    #
+    # create the monthly partitions for results and stage logs
+    #
+    # parameter:
+    #  - self
+    #  - number of months ahead
+    # return:
+    #  - list with the names of the new partitions
+    def create_partitions(self, ahead):
+        return [row['name'] for row in self.execute("""
+SELECT "public"."commitfest_test_create_partitions"(%(ahead)s) AS name""", {'ahead': ahead})]
+
+
+
+    # archivable_partitions()
+    #
+    # return the partitions with stage logs which are due for archiving
+    #
+    # parameter:
+    #  - self
+    #  - number of months the stage logs are kept
+    # return:
+    #  - list with 'name', 'month_start', 'month_end', oldest first
+    def archivable_partitions(self, months):
+        return self.execute("""
+  SELECT name, month_start, month_end
+    FROM "public"."commitfest_test_data_partitions"()
+   WHERE month_end <= NOW() - %(months)s * INTERVAL '1 month'
+ORDER BY month_start""", {'months': months})
+
+
+
+    # archive_partition()
+    #
+    # hand all stage logs of a partition over, and drop the partition
+    #
+    # parameter:
+    #  - self
+    #  - partition (from archivable_partitions())
+    #  - function which is called with the rows, must consume all rows
+    # return:
+    #  - True if the partition is archived, False if another host is working on it
+    # note:
+    #  - the rows are read with a server side cursor, the partition can be
+    #    several GB large
+    #  - the partition is only dropped if the function returns, on errors
+    #    the transaction is rolled back and the partition stays
+    #  - holds a connection until the partition is dropped
+    def archive_partition(self, partition, write_rows):
+        with self.connection() as conn:
+            with conn.cursor(cursor_factory = psycopg2.extras.RealDictCursor) as cur:
+                # only one host archives at a time
+                cur.execute("""
+SELECT pg_try_advisory_xact_lock(hashtext('commitfest_test_archive')) AS locked,
+       to_regclass(%(name)s) IS NOT NULL AS present""", {'name': '"public".' + partition['name']})
+                row = cur.fetchone()
+                if (row['locked'] is False or row['present'] is False):
+                    return False
+            # the range matches exactly one partition
+            with conn.cursor(name = 'archive_' + partition['name'], cursor_factory = psycopg2.extras.RealDictCursor) as rows:
+                rows.itersize = 100
+                rows.execute("""
+  SELECT *
+    FROM "public"."commitfest_test_data"
+   WHERE start_time >= %(month_start)s
+     AND start_time < %(month_end)s
+ORDER BY id""", partition)
+                write_rows(rows)
+            with conn.cursor() as cur:
+                cur.execute("""
+SELECT "public"."commitfest_test_drop_data_partition"(%(name)s)""", partition)
+
+        return True
+
+
+
+    # finish_job()
+    #
+    # mark a job as finished
+    #
+    # parameter:
+    #  - self
+    #  - job id
+    #  - state ('aborted', 'failed', 'success')
+    # return:
+    #  none
+    def finish_job(self, job_id, state):
+        logging.info("job " + str(job_id) + ": " + state)
+        self.execute("""
+UPDATE "public"."commitfest_test_patch"
+   SET state = %(state)s,
+       ts_finished = NOW(),
+       ts_heartbeat = NULL
+ WHERE id = %(id)s""", {'id': job_id, 'state': state})
@@ -0,0 +1,148 @@
+import os
+import time
+import logging
+import threading
+
+
+class DiskSpace:
+
+    def __init__(self, config, cleanup):
+        self.config = config
+        self.cleanup = cleanup
+        # largest measured footprint of a job, per branch
+        self.footprints = {}
+        self.lock = threading.Lock()
+        # measured size of the running jobs: build directory -> (time, size)
+        self.sizes = {}
+        # walking a build tree is expensive, measure it every 5 minutes
+        self.size_interval = 300
+
+
+
+    # directory_size()
+    #
+    # measure the space used by a directory tree
+    #
+    # parameter:
+    #  - self
+    #  - directory name
+    # return:
+    #  - size in bytes
+    # note:
+    #  - counts the allocated blocks, not the file sizes
+    def directory_size(self, dir):
+        size = 0
+        try:
+            entries = list(os.scandir(dir))
+        except OSError:
+            return 0
+        for entry in entries:
+            try:
+                if (entry.is_dir(follow_symlinks = False)):
+                    size += self.directory_size(entry.path)
+                else:
+                    size += entry.stat(follow_symlinks = False).st_blocks * 512
+            except OSError:
+                pass
+
+        return size
+
+
+
+    # active_size()
+    #
+    # return the space used by the build directory of a running job
+    #
+    # parameter:
+    #  - self
+    #  - directory name
+    # return:
+    #  - size in bytes
+    # note:
+    #  - the size is measured again after 'size_interval' seconds
+    def active_size(self, dir):
+        now = time.time()
+        if (dir not in self.sizes or now - self.sizes[dir][0] >= self.size_interval):
+            self.sizes[dir] = (now, self.directory_size(dir))
+
+        return self.sizes[dir][1]
+
+
+
+    # record()
+    #
+    # measure the footprint of a finished job
+    #
+    # parameter:
+    #  - self
+    #  - job
+    # return:
+    #  - size in bytes
+    def record(self, job):
+        size = self.directory_size(job['build-dir'])
+        with self.lock:
+            branch = job['branch_name_prefix']
+            self.footprints[branch] = max(size, self.footprints.get(branch, 0))
+        logging.info("job " + str(job['id']) + " used " + self.config.human_size(size) + " disk space")
+
+        return size
+
+
+
+    # estimate()
+    #
+    # return the expected footprint of a new job
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - size in bytes
+    # note:
+    #  - the next job can be for any branch, the largest known footprint counts
+    def estimate(self):
+        with self.lock:
+            if (len(self.footprints) > 0):
+                return max(self.footprints.values())
+
+        return self.config.get('job-space') * 1024 * 1024
+
+
+
+    # admit()
+    #
+    # return how many new jobs fit on disk
+    #
+    # parameter:
+    #  - self
+    #  - number of free job slots
+    #  - list with build directories of the running jobs
+    # return:
+    #  - number of jobs which can start
+    # note:
+    #  - every running job can still grow up to the estimate, the space it
+    #    already uses is taken into account, new jobs only start if the
+    #    free space stays above 'min-free-space'
+    #  - if there is not enough space, old builds are removed first
+    def admit(self, number, active):
+        if (number < 1):
+            return 0
+        # a job which was removed before it was measured has no footprint
+        estimate = max(1, self.estimate())
+        min_free = self.config.get('min-free-space') * 1024 * 1024
+        # forget about finished jobs
+        for dir in [dir for dir in self.sizes.keys() if dir not in active]:
+            del self.sizes[dir]
+        growth = sum([max(0, estimate - self.active_size(dir)) for dir in active])
+        needed = growth + estimate * number
+
+        free = self.cleanup.free_space()
+        if (free - needed < min_free):
+            self.cleanup.retention(active, needed)
+            free = self.cleanup.free_space()
+
+        possible = max(0, int((free - min_free - growth) / estimate))
+        if (possible < number):
+            logging.warning("disk space: " + self.config.human_size(free) + " free, " +
+                            self.config.human_size(estimate) + " per job, starting " + str(possible) + " of " + str(number) + " jobs")
+
+        return min(number, possible)
@@ -0,0 +1,146 @@
+import os
+import re
+
+
+class Impact:
+
+    def __init__(self):
+        # directories with their own test suite, the suite is the directory
+        # itself, or the first subdirectory
+        self.suite_patterns = [
+            r'^(contrib/[^/]+)/',
+            r'^(src/bin/[^/]+)/',
+            r'^(src/pl/[^/]+)/',
+            r'^(src/interfaces/ecpg)/',
+            r'^(src/test/modules/[^/]+)/',
+            r'^(src/test/(?:isolation|recovery|subscription|authentication|ssl|kerberos|ldap))/',
+        ]
+        # changes here affect the core server, the core tests cover them
+        self.core_patterns = [
+            r'^src/backend/',
+            r'^src/include/',
+            r'^src/common/',
+            r'^src/port/',
+            r'^src/timezone/',
+            r'^src/test/regress/',
+            r'^src/interfaces/libpq/',
+        ]
+        self.core_suite = 'src/test/regress'
+        # neither the build nor any test uses these files: developer tools
+        # (pgindent, typedefs.list), translations, repository metadata
+        self.ignored_patterns = [
+            r'^src/tools/',
+            r'\.po$',
+            r'(^|/)\.git[^/]*$',
+            r'^\.[^/]+$',
+        ]
+
+
+
+    # analyze()
+    #
+    # find the test suites which can be affected by a patch
+    #
+    # parameter:
+    #  - self
+    #  - list with files touched by the patches
+    # return:
+    #  - dictionary with:
+    #    - 'docs-only': True if only the documentation is modified
+    #    - 'world': True if the patch can affect everything (build system,
+    #      unknown directories), all tests have to run
+    #    - 'suites': list with the affected suites, the core suite is
+    #      always included
+    # note:
+    #  - ignored files affect no suite, the patch is still built and tested
+    def analyze(self, touched_files):
+        result = {'docs-only': True, 'world': False, 'suites': []}
+        if (len(touched_files) == 0):
+            result['docs-only'] = False
+            result['world'] = True
+
+        for filename in touched_files:
+            if (filename.startswith('doc/')):
+                continue
+            result['docs-only'] = False
+            if (self.ignored(filename) is True):
+                continue
+
+            suite = None
+            for pattern in self.suite_patterns:
+                match = re.match(pattern, filename)
+                if (match):
+                    suite = match.group(1)
+                    break
+            if (suite is not None):
+                if not (suite in result['suites']):
+                    result['suites'].append(suite)
+                continue
+
+            if (len([p for p in self.core_patterns if re.match(p, filename)]) > 0):
+                continue
+
+            # build system, tools, everything else
+            result['world'] = True
+
+        if (result['docs-only'] is False and not (self.core_suite in result['suites'])):
+            result['suites'].append(self.core_suite)
+
+        return result
+
+
+
+    # ignored()
+    #
+    # verify if a file is irrelevant for the build and the tests
+    #
+    # parameter:
+    #  - self
+    #  - filename
+    # return:
+    #  - True/False
+    def ignored(self, filename):
+        if (len([p for p in self.ignored_patterns if re.search(p, filename)]) > 0):
+            return True
+
+        return False
+
+
+
+    # affected()
+    #
+    # verify if upstream changes can affect a patch
+    #
+    # parameter:
+    #  - self
+    #  - list with files changed upstream
+    #  - list with files touched by the patches
+    # return:
+    #  - True/False
+    # note:
+    #  - the patch is affected if the changes touch the same files, the
+    #    same directories, the same test suites (except the core tests),
+    #    or the build system
+    #  - ignored files do not count, not even if both sides touch them, a
+    #    conflict in typedefs.list is found by the periodic sweep
+    def affected(self, changed_files, touched_files):
+        changed_files = [f for f in changed_files if self.ignored(f) is False]
+        touched_files = [f for f in touched_files if self.ignored(f) is False]
+        if (len(changed_files) == 0):
+            return False
+        if (len(set(changed_files) & set(touched_files)) > 0):
+            return True
+
+        changed = self.analyze(changed_files)
+        if (changed['world'] is True):
+            return True
+        touched = self.analyze(touched_files)
+        if (len((set(changed['suites']) & set(touched['suites'])) - set([self.core_suite])) > 0):
+            return True
+
+        changed_dirs = set([os.path.dirname(f) for f in changed_files])
+        touched_dirs = set([os.path.dirname(f) for f in touched_files])
+        if (len(changed_dirs & touched_dirs) > 0):
+            return True
+
+        return False
@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import logging
+import sqlite3
+import datetime
+import threading
+
+
+class Journal:
+
+    def __init__(self, config):
+        self.config = config
+        # the journal survives crashes of the tool, and cleanups of the cache
+        self.filename = os.path.join(config.get('top-dir'), 'testtool_journal.sqlite')
+        # job keys which are rebuilt when a job resumes
+        self.volatile_keys = ['env', 'logs']
+        # a job in one of these stages has a prepared and patched source
+        # directory, and can continue with the stage
+        self.resume_stages = ['configure', 'make', 'install', 'tests']
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.filename, check_same_thread = False)
+        self.connection.execute("""
+CREATE TABLE IF NOT EXISTS jobs (
+    id          INTEGER  PRIMARY KEY,
+    build_dir   TEXT     NOT NULL,
+    stage       TEXT     NOT NULL,
+    ts_updated  REAL     NOT NULL,
+    job         TEXT     NOT NULL
+)""")
+        self.connection.commit()
+
+
+
+    # update()
+    #
+    # record the current stage of a job
+    #
+    # parameter:
+    #  - self
+    #  - job
+    #  - stage name
+    # return:
+    #  none
+    # note:
+    #  - the job is written as well, with the results and the log excerpts
+    #    of all finished stages, a resumed job stores them with the result
+    def update(self, job, stage):
+        data = dict([(key, value) for key, value in job.items() if not (key in self.volatile_keys)])
+        data['stage-excerpts'] = dict(job.get('stage-excerpts', {}))
+        for name, log in job.get('logs', {}).items():
+            data['stage-excerpts'][name] = log.excerpt()
+        with self.lock:
+            if (self.connection is None):
+                return
+            self.connection.execute("INSERT OR REPLACE INTO jobs (id, build_dir, stage, ts_updated, job) VALUES (?, ?, ?, ?, ?)",
+                                    (job['id'], job['build-dir'], stage, time.time(), json.dumps(data, default = str)))
+            self.connection.commit()
+
+
+
+    # remove()
+    #
+    # remove a finished job from the journal
+    #
+    # parameter:
+    #  - self
+    #  - job id
+    # return:
+    #  none
+    def remove(self, job_id):
+        with self.lock:
+            if (self.connection is None):
+                return
+            self.connection.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            self.connection.commit()
+
+
+
+    # unfinished()
+    #
+    # return all jobs which did not finish, usually because the tool crashed
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - list with jobs, every job has the additional key 'journal-stage'
+    def unfinished(self):
+        with self.lock:
+            rows = self.connection.execute("SELECT stage, job FROM jobs ORDER BY id").fetchall()
+
+        jobs = []
+        for row in rows:
+            job = json.loads(row[1])
+            job['journal-stage'] = row[0]
+            if ('start_time' in job):
+                job['start_time'] = datetime.datetime.fromisoformat(job['start_time'])
+            jobs.append(job)
+
+        return jobs
+
+
+
+    # resumable()
+    #
+    # verify if a job from the journal can continue where it stopped
+    #
+    # parameter:
+    #  - self
+    #  - job from unfinished()
+    # return:
+    #  - True/False
+    def resumable(self, job):
+        if not (job['journal-stage'] in self.resume_stages):
+            return False
+        if (job.get('result_patch') != 0 or os.path.isdir(job.get('source-dir', '')) is False):
+            return False
+        if (os.path.isdir(job.get('log-dir', '')) is False):
+            return False
+        for filename in job.get('patch-files', []):
+            if (os.path.isfile(filename) is False):
+                return False
+        logging.debug("job " + str(job['id']) + " can resume in stage " + job['journal-stage'])
+
+        return True
+
+
+
+    # close()
+    #
+    # close the journal
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def close(self):
+        with self.lock:
+            if (self.connection is not None):
+                self.connection.close()
+                self.connection = None
@@ -0,0 +1,670 @@
+import io
+import os
+import re
+import gzip
+import zlib
+import email.parser
+import mailbox
+import shutil
+import tarfile
+import json
+import time
+import hashlib
+import logging
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+
+
+class Patch:
+
+    def __init__(self, config):
+        self.config = config
+        self.cache_dir = config.get('cache-dir')
+        # one lock per patch, jobs fetching the same patch wait for each other
+        self.locks = {}
+        self.locks_lock = threading.Lock()
+        self.evict_lock = threading.Lock()
+        # patches in use by jobs are never evicted, filename -> number of users
+        self.pins = {}
+        self.pins_lock = threading.Lock()
+        # downloads and unpacking are streamed in chunks of this size
+        self.chunk_size = 64 * 1024
+        # how to turn the download into an applicable patch, by patch type
+        self.unpack_functions = {
+            'message-id': self.unpack_message,
+            'patch': self.unpack_plain,
+            'pull request': self.unpack_plain,
+        }
+
+
+
+    # patch_url()
+    #
+    # build the download url for a patch
+    #
+    # parameter:
+    #  - self
+    #  - patch location (from "commitfest_patch")
+    #  - patch type name (from "commitfest_patch_type")
+    # return:
+    #  - url, or False
+    def patch_url(self, location, type):
+        if (type == 'message-id'):
+            # the raw message, including all attachments
+            location = location.strip().strip('<>')
+            return 'https://www.postgresql.org/message-id/raw/' + urllib.parse.quote(location, safe = '@')
+        if (type == 'patch'):
+            return location
+        if (type == 'pull request'):
+            # GitHub delivers the diff for a PR, if '.diff' is added to the url
+            location = location.rstrip('/')
+            if (re.search(r'/pull/\d+$', location) is None):
+                logging.error("not a GitHub pull request: " + location)
+                return False
+            return location + '.diff'
+
+        logging.error("unknown patch type: " + str(type))
+        return False
+
+
+
+    # cache_files()
+    #
+    # return the names of all cache files for a patch location
+    #
+    # parameter:
+    #  - self
+    #  - hashname
+    # return:
+    #  - dictionary with 'diff' and 'meta' filenames
+    # note:
+    #  - 'unpacked' is the name used by older versions, it is only removed
+    def cache_files(self, hashname):
+        base = os.path.join(self.cache_dir, hashname + '.diff')
+        return {'diff': base, 'unpacked': base + '.unpacked', 'meta': base + '.meta'}
+
+
+
+    # content_file()
+    #
+    # return the name of an unpacked patch in the cache
+    #
+    # parameter:
+    #  - self
+    #  - sha256 of the unpacked patch
+    # return:
+    #  - filename
+    # note:
+    #  - the unpacked patches are stored by content, a changed patch at the
+    #    same location is a new file, and a running job keeps its version
+    def content_file(self, sha256):
+        return os.path.join(self.cache_dir, sha256 + '.patch')
+
+
+
+    # pin()
+    #
+    # mark an unpacked patch as used by a job
+    #
+    # parameter:
+    #  - self
+    #  - filename
+    # return:
+    #  - True, or False if the file does not exist
+    def pin(self, filename):
+        with self.pins_lock:
+            if (os.path.isfile(filename) is False):
+                return False
+            self.pins[filename] = self.pins.get(filename, 0) + 1
+
+        return True
+
+
+
+    # release()
+    #
+    # mark unpacked patches as no longer used by a job
+    #
+    # parameter:
+    #  - self
+    #  - list with filenames
+    # return:
+    #  none
+    def release(self, filenames):
+        with self.pins_lock:
+            for filename in filenames:
+                if (self.pins.get(filename, 0) > 1):
+                    self.pins[filename] -= 1
+                elif (filename in self.pins):
+                    del self.pins[filename]
+
+
+
+    # lock_for()
+    #
+    # return the lock for a single patch
+    #
+    # parameter:
+    #  - self
+    #  - hashname
+    # return:
+    #  - lock
+    def lock_for(self, hashname):
+        with self.locks_lock:
+            if not (hashname in self.locks):
+                self.locks[hashname] = threading.Lock()
+            return self.locks[hashname]
+
+
+
+    # read_meta()
+    #
+    # read the metadata of a cached patch
+    #
+    # parameter:
+    #  - self
+    #  - filename
+    # return:
+    #  - dictionary with metadata, or False
+    def read_meta(self, filename):
+        try:
+            with open(filename, 'r') as fh:
+                return json.load(fh)
+        except (IOError, OSError, ValueError):
+            return False
+
+
+
+    # tmp_name()
+    #
+    # return a temporary filename next to a file
+    #
+    # parameter:
+    #  - self
+    #  - filename
+    # return:
+    #  - temporary filename
+    def tmp_name(self, filename):
+        return filename + '.tmp.' + str(os.getpid()) + '.' + str(threading.current_thread().ident)
+
+
+
+    # write_file()
+    #
+    # write a file atomically
+    #
+    # parameter:
+    #  - self
+    #  - filename
+    #  - content (bytes)
+    # return:
+    #  none
+    def write_file(self, filename, content):
+        tmp = self.tmp_name(filename)
+        with open(tmp, 'wb') as fh:
+            fh.write(content)
+        os.rename(tmp, filename)
+
+
+
+    # file_sha256()
+    #
+    # calculate the sha256 hash of a file
+    #
+    # parameter:
+    #  - self
+    #  - filename
+    # return:
+    #  - hash string
+    def file_sha256(self, filename):
+        h = hashlib.sha256()
+        with open(filename, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(self.chunk_size), b''):
+                h.update(chunk)
+
+        return h.hexdigest()
+
+
+
+    # download()
+    #
+    # download a url into a file, revalidate with ETag and Last-Modified
+    #
+    # parameter:
+    #  - self
+    #  - url
+    #  - metadata of the cached version, or False
+    #  - filename
+    # return:
+    #  - list with status ('new', 'not-modified' or False) and response headers
+    # note:
+    #  - the content is streamed into the file, and never held in memory
+    def download(self, url, meta, filename):
+        request = urllib.request.Request(url, headers = {'User-Agent': 'pg_commitfest_testtool'})
+        if (meta is not False and meta['url'] == url):
+            if (meta.get('etag')):
+                request.add_header('If-None-Match', meta['etag'])
+            if (meta.get('last-modified')):
+                request.add_header('If-Modified-Since', meta['last-modified'])
+
+        tmp = self.tmp_name(filename)
+        try:
+            response = urllib.request.urlopen(request, timeout = 60)
+            with open(tmp, 'wb') as fh:
+                shutil.copyfileobj(response, fh, self.chunk_size)
+            response.close()
+        except urllib.error.HTTPError as e:
+            if (e.code == 304):
+                return ['not-modified', e.headers]
+            logging.error("download failed (" + str(e.code) + "): " + url)
+            return [False, None]
+        except (urllib.error.URLError, IOError, OSError) as e:
+            if (os.path.isfile(tmp)):
+                os.remove(tmp)
+            logging.error("download failed (" + str(e) + "): " + url)
+            return [False, None]
+        os.rename(tmp, filename)
+
+        return ['new', response.headers]
+
+
+
+    # fetch()
+    #
+    # return the unpacked patch, download it if required
+    #
+    # parameter:
+    #  - self
+    #  - patch location
+    #  - patch type name
+    # return:
+    #  - filename of the unpacked patch, or False
+    # note:
+    #  - the download is keyed by the hashname of the location, every patch
+    #    is downloaded and unpacked once, no matter how many jobs use it
+    #  - message-ids are immutable, other patches are revalidated after
+    #    'patch-revalidate-interval' seconds
+    #  - the unpacked patch is pinned, and has to be released by the caller
+    def fetch(self, location, type):
+        url = self.patch_url(location, type)
+        if (url is False):
+            return False
+        hashname = self.config.create_hashname(location)
+        files = self.cache_files(hashname)
+
+        with self.lock_for(hashname):
+            meta = self.read_meta(files['meta'])
+            filename = False
+            if (meta is not False and meta.get('sha256') is not None):
+                filename = self.content_file(meta['sha256'])
+            if (meta is not False and (type == 'message-id' or time.time() - meta['checked'] < self.config.get('patch-revalidate-interval'))):
+                if (filename is not False and self.pin(filename) is True):
+                    logging.debug("patch from cache: " + location)
+                    self.touch(filename)
+                    return filename
+                # the unpacked patch was evicted
+                meta = False
+
+            ret = self.download(url, meta, files['diff'])
+            if (ret[0] is False):
+                if (filename is not False and self.pin(filename) is True):
+                    # better an old version than nothing
+                    logging.warning("using cached version of patch: " + location)
+                    self.touch(filename)
+                    return filename
+                return False
+
+            if (ret[0] == 'not-modified'):
+                if (filename is not False and self.pin(filename) is True):
+                    logging.debug("patch not modified: " + location)
+                    meta['checked'] = time.time()
+                    self.write_file(files['meta'], json.dumps(meta).encode('utf-8'))
+                    self.touch(filename)
+                    return filename
+                # the unpacked patch was evicted in the meantime
+                ret = self.download(url, False, files['diff'])
+                if (ret[0] is False):
+                    return False
+
+            logging.info("downloaded patch (" + self.config.human_size(os.path.getsize(files['diff'])) + "): " + location)
+            tmp = self.tmp_name(files['unpacked'])
+            try:
+                result = self.unpack_functions[type](files['diff'], tmp)
+            except (IOError, OSError, EOFError, zlib.error, tarfile.TarError) as e:
+                logging.error("unpack failed: " + str(e))
+                result = False
+            if (result is False or os.path.getsize(tmp) == 0):
+                logging.error("cannot unpack patch: " + location)
+                if (os.path.isfile(tmp)):
+                    os.remove(tmp)
+                return False
+            sha256 = self.file_sha256(tmp)
+            filename = self.content_file(sha256)
+            with self.pins_lock:
+                os.rename(tmp, filename)
+                self.pins[filename] = self.pins.get(filename, 0) + 1
+            meta = {
+                'location': location,
+                'type': type,
+                'url': url,
+                'etag': ret[1].get('ETag'),
+                'last-modified': ret[1].get('Last-Modified'),
+                'downloaded': time.time(),
+                'checked': time.time(),
+                'size': os.path.getsize(filename),
+                'sha256': sha256,
+            }
+            self.write_file(files['meta'], json.dumps(meta).encode('utf-8'))
+
+        self.evict()
+        return filename
+
+
+
+    # fetch_patchset()
+    #
+    # return all unpacked patches for a job, in order
+    #
+    # parameter:
+    #  - self
+    #  - list with patches (dictionaries with 'patch_location' and 'patch_type')
+    # return:
+    #  - list with filenames, or False
+    # note:
+    #  - the patches are pinned, and have to be released by the caller
+    def fetch_patchset(self, patches):
+        result = []
+        for patch in patches:
+            filename = self.fetch(patch['patch_location'], patch['patch_type'])
+            if (filename is False):
+                self.release(result)
+                return False
+            result.append(filename)
+
+        return result
+
+
+
+    # patchset_hash()
+    #
+    # return a hash over the content of a set of patches
+    #
+    # parameter:
+    #  - self
+    #  - list with filenames of unpacked patches
+    # return:
+    #  - hash
+    # note:
+    #  - the same patches from a different location have the same hash
+    def patchset_hash(self, filenames):
+        return self.config.create_hashname(' '.join([self.file_sha256(filename) for filename in filenames]))
+
+
+
+    # touched_files()
+    #
+    # return all files which are modified by a set of patches
+    #
+    # parameter:
+    #  - self
+    #  - list with filenames of unpacked patches
+    # return:
+    #  - sorted list with filenames, relative to the top of the source
+    # note:
+    #  - the lines of a hunk are counted, and skipped, a removed line can
+    #    start with '---' as well
+    def touched_files(self, filenames):
+        result = set()
+        for filename in filenames:
+            with open(filename, 'rb') as fh:
+                old_lines = 0
+                new_lines = 0
+                for line in fh:
+                    if (old_lines > 0 or new_lines > 0):
+                        if (line.startswith(b'-')):
+                            old_lines -= 1
+                        elif (line.startswith(b'+')):
+                            new_lines -= 1
+                        elif (line.startswith(b'\\') is False):
+                            old_lines -= 1
+                            new_lines -= 1
+                        continue
+                    hunk_match = re.match(rb'^@@ -\d+(?:,(\d+))? \+\d+(?:,(\d+))? @@', line)
+                    if (hunk_match):
+                        old_lines = int(hunk_match.group(1) or 1)
+                        new_lines = int(hunk_match.group(2) or 1)
+                        continue
+                    # both the old and the new name of a renamed file count
+                    line_match = re.match(rb'^diff --git a/(\S+) b/(\S+)', line)
+                    if (line_match):
+                        result.add(line_match.group(1).decode('utf-8', 'replace'))
+                        result.add(line_match.group(2).decode('utf-8', 'replace'))
+                        continue
+                    line_match = re.match(rb'^(?:---|\+\+\+) (?:[ab]/)?(\S+)', line)
+                    if (line_match and line_match.group(1) != b'/dev/null'):
+                        result.add(line_match.group(1).decode('utf-8', 'replace'))
+
+        return sorted(result)
+
+
+
+    # unpack_plain()
+    #
+    # unpack a downloaded patch file
+    #
+    # parameter:
+    #  - self
+    #  - filename of the download
+    #  - filename of the unpacked patch
+    # return:
+    #  - True/False
+    def unpack_plain(self, source, target):
+        with open(source, 'rb') as fh:
+            magic = fh.read(2)
+        if (magic == b'\x1f\x8b'):
+            src = gzip.open(source, 'rb')
+        else:
+            src = open(source, 'rb')
+        with src, open(target, 'wb') as dst:
+            shutil.copyfileobj(src, dst, self.chunk_size)
+
+        return True
+
+
+
+    # unpack_message()
+    #
+    # extract all patches from a raw message, or a mbox
+    #
+    # parameter:
+    #  - self
+    #  - filename of the download
+    #  - filename of the unpacked patch
+    # return:
+    #  - True/False
+    # note:
+    #  - the messages are parsed one by one from disk, the download itself is
+    #    never loaded into memory as a whole
+    #  - all patch attachments are written into the target, in the order
+    #    in which they appear in the message(s)
+    def unpack_message(self, source, target):
+        with open(source, 'rb') as fh:
+            is_mbox = fh.read(5) == b'From '
+
+        found = 0
+        with open(target, 'wb') as dst:
+            if (is_mbox is True):
+                mbox = mailbox.mbox(source, create = False)
+                try:
+                    for key in mbox.iterkeys():
+                        with mbox.get_file(key) as fh:
+                            found += self.extract_attachments(fh, dst)
+                finally:
+                    mbox.close()
+            else:
+                with open(source, 'rb') as fh:
+                    found += self.extract_attachments(fh, dst)
+
+        if (found == 0):
+            logging.error("no patches found in message")
+            return False
+        logging.debug("extracted " + str(found) + " patch(es) from message")
+
+        return True
+
+
+
+    # extract_attachments()
+    #
+    # parse a single message, and write all patch attachments into a file
+    #
+    # parameter:
+    #  - self
+    #  - file handle with the message
+    #  - file handle for the patches
+    # return:
+    #  - number of patches found
+    def extract_attachments(self, fh, dst):
+        parser = email.parser.BytesFeedParser()
+        for chunk in iter(lambda: fh.read(self.chunk_size), b''):
+            parser.feed(chunk)
+        message = parser.close()
+
+        found = 0
+        for part in message.walk():
+            if (part.is_multipart()):
+                continue
+            filename = part.get_filename()
+            if (filename is None):
+                filename = ''
+            filename = filename.lower()
+            content_type = part.get_content_type()
+            if (re.search(r'\.(tar\.gz|tgz|tar\.bz2|tar)$', filename)):
+                found += self.extract_tar(part.get_payload(decode = True), dst)
+            elif (re.search(r'\.(patch|diff)\.gz$', filename)):
+                self.write_patch(dst, gzip.decompress(part.get_payload(decode = True)))
+                found += 1
+            elif (re.search(r'\.(patch|diff)$', filename) or content_type in ['text/x-diff', 'text/x-patch']):
+                self.write_patch(dst, part.get_payload(decode = True))
+                found += 1
+            else:
+                continue
+            logging.debug("patch attachment: " + filename)
+
+        return found
+
+
+
+    # write_patch()
+    #
+    # append a single patch to a file
+    #
+    # parameter:
+    #  - self
+    #  - file handle for the patches
+    #  - patch (bytes)
+    # return:
+    #  none
+    # note:
+    #  - without a newline at the end, the last line of the patch would run
+    #    into the header of the next patch
+    def write_patch(self, dst, content):
+        if (content is None or len(content) == 0):
+            return
+        dst.write(content)
+        if (content.endswith(b'\n') is False):
+            dst.write(b'\n')
+
+
+
+    # extract_tar()
+    #
+    # write all patches from a tar archive into a file
+    #
+    # parameter:
+    #  - self
+    #  - tar archive (bytes)
+    #  - file handle for the patches
+    # return:
+    #  - number of patches found
+    # note:
+    #  - the patches are sorted by name, patch series are usually numbered
+    def extract_tar(self, content, dst):
+        found = 0
+        with tarfile.open(fileobj = io.BytesIO(content), mode = 'r:*') as tar:
+            members = [m for m in tar.getmembers() if (m.isfile() and re.search(r'\.(patch|diff)$', m.name.lower()))]
+            for member in sorted(members, key = lambda m: m.name):
+                self.write_patch(dst, tar.extractfile(member).read())
+                found += 1
+
+        return found
+
+
+
+    # touch()
+    #
+    # mark a cached patch as used, for the LRU eviction
+    #
+    # parameter:
+    #  - self
+    #  - filename
+    # return:
+    #  none
+    def touch(self, filename):
+        try:
+            os.utime(filename, None)
+        except OSError:
+            pass
+
+
+
+    # evict()
+    #
+    # remove cached patches which are too old, or exceed the cache size
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    # note:
+    #  - the least recently used patches are removed first
+    #  - downloads and unpacked patches are evicted independently, a
+    #    download without unpacked patch is unpacked again
+    #  - patches which are pinned by a job are never removed
+    def evict(self):
+        with self.evict_lock:
+            entries = {}
+            for entry in os.scandir(self.cache_dir):
+                entry_match = re.match(r'^([a-f0-9]+)\.(diff(\.unpacked|\.meta)?|patch)$', entry.name)
+                if not (entry_match and entry.is_file()):
+                    continue
+                key = entry_match.group(1) + ('.patch' if entry_match.group(2) == 'patch' else '')
+                if not (key in entries):
+                    entries[key] = {'size': 0, 'used': 0}
+                stat = entry.stat()
+                entries[key]['size'] += stat.st_size
+                entries[key]['used'] = max(entries[key]['used'], stat.st_mtime)
+
+            max_age = time.time() - self.config.get('patch-cache-max-age') * 86400
+            max_size = self.config.get('patch-cache-max-size') * 1024 * 1024
+            total_size = sum([e['size'] for e in entries.values()])
+            for key in sorted(entries.keys(), key = lambda k: entries[k]['used']):
+                if (entries[key]['used'] >= max_age and total_size <= max_size):
+                    break
+                if (key.endswith('.patch')):
+                    filename = os.path.join(self.cache_dir, key)
+                    with self.pins_lock:
+                        if (filename in self.pins):
+                            continue
+                        logging.debug("evict patch: " + key + " (" + self.config.human_size(entries[key]['size']) + ")")
+                        if (os.path.isfile(filename)):
+                            os.remove(filename)
+                else:
+                    with self.lock_for(key):
+                        logging.debug("evict download: " + key + " (" + self.config.human_size(entries[key]['size']) + ")")
+                        for filename in self.cache_files(key).values():
+                            if (os.path.isfile(filename)):
+                                os.remove(filename)
+                total_size -= entries[key]['size']
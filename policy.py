@@ -0,0 +1,156 @@
+import math
+import time
+import logging
+
+
+class Policy:
+
+    def __init__(self, config, database):
+        self.config = config
+        self.database = database
+        # the history changes slowly, don't ask the database on every lookup
+        self.refresh_interval = 600
+        self.last_refresh = 0
+        self.durations = {}
+        # predictions are only trusted after a few jobs
+        self.min_jobs = 3
+        # without any history, jobs are expected to take one hour
+        self.default_duration = 3600.0
+        # look at more candidates than there are free slots
+        self.window = 10
+
+
+
+    # size_class()
+    #
+    # return the size class of a patch, same as in Database.duration_history()
+    #
+    # parameter:
+    #  - self
+    #  - patch size in bytes, or None
+    # return:
+    #  - size class, or None
+    def size_class(self, size):
+        if (size is None):
+            return None
+
+        return int(math.floor(math.log2(max(size, 1024) / 1024.0)))
+
+
+
+    # refresh()
+    #
+    # load the durations of earlier jobs
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    # note:
+    #  - the durations are averaged per branch, platform and size class,
+    #    per branch and platform, and over all jobs
+    def refresh(self):
+        if (time.time() - self.last_refresh < self.refresh_interval):
+            return
+        self.last_refresh = time.time()
+
+        totals = {}
+        for row in self.database.duration_history():
+            for key in [(row['pg_version'], row['platform'], row['size_class']),
+                        (row['pg_version'], row['platform']),
+                        ()]:
+                if not (key in totals):
+                    totals[key] = [0.0, 0]
+                totals[key][0] += float(row['duration']) * row['jobs']
+                totals[key][1] += row['jobs']
+        self.durations = dict([(key, [value[0] / value[1], value[1]]) for key, value in totals.items()])
+
+
+
+    # predict()
+    #
+    # predict the duration of a queued job
+    #
+    # parameter:
+    #  - self
+    #  - job (from Database.queued_jobs())
+    # return:
+    #  - duration in seconds
+    def predict(self, job):
+        for key in [(job['pg_version'], job['platform'], self.size_class(job['patch_size'])),
+                    (job['pg_version'], job['platform']),
+                    ()]:
+            if (key in self.durations and self.durations[key][1] >= self.min_jobs):
+                return self.durations[key][0]
+
+        return self.default_duration
+
+
+
+    # choose()
+    #
+    # choose the next jobs, shortest expected job first
+    #
+    # parameter:
+    #  - self
+    #  - number of free slots
+    #  - True if this host runs no jobs
+    # return:
+    #  - list with job ids
+    # note:
+    #  - the priority of a job always comes first
+    #  - the predicted duration shrinks while a job waits, after 'aging'
+    #    seconds every job is treated like a short one, and the oldest job
+    #    goes first, this way long jobs do not starve
+    #  - no patch set runs more than 'max-jobs-per-patch' times at once
+    def choose(self, number, idle):
+        self.refresh()
+        candidates = self.database.queued_jobs(number * self.window, idle = idle)
+        aging = self.config.get('scheduling-aging')
+
+        def score(job):
+            predicted = self.predict(job)
+            if (aging > 0):
+                predicted = predicted * max(0.0, 1.0 - float(job['waiting']) / aging)
+            return (-job['priority'], predicted, -float(job['waiting']), job['id'])
+
+        chosen = []
+        running = {}
+        for job in sorted(candidates, key = score):
+            if (len(chosen) >= number):
+                break
+            count = running.get(job['locations'], job['running'])
+            if (count >= self.config.get('scheduling-max-jobs-per-patch')):
+                continue
+            running[job['locations']] = count + 1
+            chosen.append(job['id'])
+        logging.debug("sejf: chose " + str(chosen) + " from " + str(len(candidates)) + " queued jobs")
+
+        return chosen
+
+
+
+    # claim_jobs()
+    #
+    # claim the next jobs for this host
+    #
+    # parameter:
+    #  - self
+    #  - number of free slots
+    #  - True if this host runs no jobs
+    # return:
+    #  - list with jobs
+    # note:
+    #  - another host can claim a chosen job in the meantime, then fewer
+    #    jobs are returned
+    def claim_jobs(self, number, idle = False):
+        if (number < 1):
+            return []
+        if (self.config.get('scheduling-policy') == 'fifo'):
+            return self.database.claim_jobs(number, idle = idle)
+
+        job_ids = self.choose(number, idle)
+        if (len(job_ids) == 0):
+            return []
+
+        return self.database.claim_jobs(number, job_ids = job_ids, idle = idle)
@@ -0,0 +1,157 @@
+import os
+import logging
+import datetime
+import concurrent.futures
+from time import localtime, strftime
+from stagelog import StageLog
+
+
+class Preflight:
+
+    def __init__(self, config, database, repository, patch):
+        self.config = config
+        self.database = database
+        self.repository = repository
+        self.patch = patch
+        # the checks are mostly waiting for downloads and git
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers = 4)
+
+
+
+    # run()
+    #
+    # check if the patches of queued jobs apply, fail the jobs which don't
+    #
+    # parameter:
+    #  - self
+    #  - maximum number of jobs to check
+    # return:
+    #  none
+    # note:
+    #  - jobs which pass the check are returned into the queue, jobs which
+    #    fail are finished right away, without using a job slot
+    #  - runs on every poll, also if all job slots are in use, regular jobs
+    #    wait for the check
+    #  - no job stays claimed, even if the check itself fails
+    def run(self, number):
+        jobs = self.database.claim_jobs(number, preflight = True)
+        if (len(jobs) == 0):
+            return
+
+        passed = []
+        unknown = []
+        done = []
+        try:
+            if (self.repository.update_mirror() is False):
+                # releasing the jobs would wake up all hosts, and check them again
+                self.database.mark_apply_checked([job['id'] for job in jobs])
+                done = [job['id'] for job in jobs]
+                return
+
+            futures = [self.executor.submit(self.check_job, job) for job in jobs]
+            for job, future in zip(jobs, futures):
+                try:
+                    result = future.result()
+                except Exception:
+                    logging.exception("job " + str(job['id']) + ": apply check failed")
+                    result = None
+                if (result is True):
+                    passed.append(job['id'])
+                elif (result is None):
+                    unknown.append(job['id'])
+                else:
+                    try:
+                        self.fail_job(job, result)
+                        done.append(job['id'])
+                    except Exception:
+                        logging.exception("job " + str(job['id']) + ": cannot store the failed apply check")
+                        unknown.append(job['id'])
+
+            logging.debug("apply check: " + str(len(passed)) + " passed, " + str(len(done)) + " failed")
+            # something else went wrong, the regular job will find out, the
+            # check is not repeated
+            self.database.mark_apply_checked(passed + unknown)
+            done += passed + unknown
+        finally:
+            # on errors, the remaining jobs are checked again with the next poll
+            remaining = [job['id'] for job in jobs if not (job['id'] in done)]
+            if (len(remaining) > 0):
+                self.database.release_claims(remaining)
+
+
+
+    # check_job()
+    #
+    # check if the patches of a job apply to the branch
+    #
+    # parameter:
+    #  - self
+    #  - job
+    # return:
+    #  - True if the patches apply, None if the check was not possible,
+    #    otherwise the output of 'git apply'
+    def check_job(self, job):
+        files = self.patch.fetch_patchset(job['patches'])
+        if (files is False):
+            return None
+        try:
+            return self.check_patches(job, files)
+        finally:
+            self.patch.release(files)
+
+
+
+    # check_patches()
+    #
+    # check if the downloaded patches of a job apply to the branch
+    #
+    # parameter:
+    #  - self
+    #  - job
+    #  - list with filenames of the patches
+    # return:
+    #  - see check_job()
+    def check_patches(self, job, files):
+        # the scheduling policy predicts the duration by the size
+        self.database.set_patch_size(job['id'], sum([os.path.getsize(f) for f in files]))
+        job['branch'] = self.repository.branch_name(job['branch_name_prefix'])
+        job['git_revision'] = self.repository.branch_revision(job['branch_name_prefix'])
+        if (job['branch'] is False or job['git_revision'] is False):
+            return None
+
+        ret = self.repository.apply_check(job['git_revision'], files)
+        if (ret[0] == 0):
+            return True
+        logging.info("job " + str(job['id']) + ": patches do not apply to " + job['branch'])
+
+        return ret[1]
+
+
+
+    # fail_job()
+    #
+    # finish a job whose patches do not apply
+    #
+    # parameter:
+    #  - self
+    #  - job
+    #  - output of 'git apply'
+    # return:
+    #  none
+    def fail_job(self, job, output):
+        job['start_time'] = datetime.datetime.now(datetime.timezone.utc)
+        job['log-dir'] = os.path.join(self.config.get('log-dir'), strftime("%Y-%m-%d_%H%M%S", localtime()) + '_' + str(job['id']))
+        os.mkdir(job['log-dir'])
+        log = StageLog(self.config, os.path.join(job['log-dir'], 'patch.log.gz'))
+        log.write("$ git apply --check (revision " + job['git_revision'] + ")\n")
+        log.write(output)
+        log.close()
+        job['logs'] = {'patch': log}
+        job['result_git_update'] = 0
+        job['result_patch'] = 1
+        job['errorstr'] = 'patch does not apply'
+        job['end_time'] = datetime.datetime.now(datetime.timezone.utc)
+
+        self.database.set_git_revision(job['id'], job['git_revision'])
+        self.database.store_result(job)
+        self.database.finish_job(job['id'], 'failed')
@@ -0,0 +1,144 @@
+import os
+import re
+
+
+class Regress:
+
+    def __init__(self, source_dir):
+        # suite names are relative to the source directory
+        self.source_dir = os.path.realpath(source_dir)
+        self.suites = {}
+        # directories 'make' is working in, the innermost last, None for
+        # directories outside of the source
+        self.directories = []
+
+
+
+    # suite()
+    #
+    # return the timing record of a suite, create it if required
+    #
+    # parameter:
+    #  - self
+    #  - suite name
+    # return:
+    #  - dictionary with 'tests', 'time' (ms) and 'failed'
+    def suite(self, name):
+        if not (name in self.suites):
+            self.suites[name] = {'tests': {}, 'time': 0, 'failed': []}
+
+        return self.suites[name]
+
+
+
+    # current_suite()
+    #
+    # return the suite of the directory 'make' is working in
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - suite name
+    # note:
+    #  - a suite can run 'make' in other directories first, for example
+    #    contrib builds pg_regress in src/test/regress, the suite is known
+    #    again once 'make' leaves these directories
+    def current_suite(self):
+        for dir in reversed(self.directories):
+            if (dir is not None):
+                return dir
+
+        return '.'
+
+
+
+    # add_test()
+    #
+    # record the result of a single test
+    #
+    # parameter:
+    #  - self
+    #  - test name
+    #  - duration in ms (or None)
+    #  - True if the test failed
+    # return:
+    #  none
+    def add_test(self, name, duration, failed):
+        suite = self.suite(self.current_suite())
+        if (duration is not None):
+            suite['tests'][name] = duration
+            suite['time'] += duration
+        if (failed is True):
+            suite['failed'].append(name)
+
+
+
+    # parse_line()
+    #
+    # parse a single line of test output
+    #
+    # parameter:
+    #  - self
+    #  - line
+    # return:
+    #  none
+    # note:
+    #  - the suite is the directory 'make' is working in, run 'make' with
+    #    output synchronization, otherwise parallel suites are mixed up
+    def parse_line(self, line):
+        # make[2]: Entering directory '/path/to/source/src/test/regress'
+        # make[2]: Leaving directory '/path/to/source/src/test/regress'
+        line_match = re.match(r"^make(?:\[\d+\])?: (Entering|Leaving) directory [`'](.+)'", line)
+        if (line_match):
+            dir = os.path.realpath(line_match.group(2))
+            if (dir == self.source_dir or dir.startswith(self.source_dir + os.sep)):
+                dir = os.path.relpath(dir, self.source_dir)
+            else:
+                dir = None
+            if (line_match.group(1) == 'Entering'):
+                self.directories.append(dir)
+            elif (dir in self.directories):
+                # the innermost entry, even if a line got lost in between
+                index = len(self.directories) - 1 - self.directories[::-1].index(dir)
+                del self.directories[index:]
+            return
+
+        # pg_regress, PostgreSQL 16 and newer
+        # ok 12        + select                                    150 ms
+        # not ok 13    - select_into                               45 ms
+        line_match = re.match(r'^(not )?ok\s+\d+\s+[-+]?\s*(\S+)\s+(\d+) ms', line)
+        if (line_match):
+            self.add_test(line_match.group(2), int(line_match.group(3)), line_match.group(1) is not None)
+            return
+
+        # pg_regress, older versions, the timing is only available since PostgreSQL 10
+        # test select                   ... ok          150 ms
+        #      select_into              ... FAILED       45 ms
+        line_match = re.match(r'^\s*(?:test\s+)?(\S+)\s+\.\.\.\s+(ok|FAILED|failed \(ignored\))(?:\s+(\d+) ms)?', line)
+        if (line_match):
+            duration = None
+            if (line_match.group(3) is not None):
+                duration = int(line_match.group(3))
+            self.add_test(line_match.group(1), duration, line_match.group(2) == 'FAILED')
+            return
+
+        # TAP tests, with 'prove --timer'
+        # [12:34:56] t/001_basic.pl ........ ok     1234 ms ( 0.01 usr ...)
+        line_match = re.match(r'^\[[\d:]+\]\s+(t/\S+?)\s+\.+\s+(ok|Dubious|Failed|skipped)\S*\s+(\d+) ms', line)
+        if (line_match):
+            self.add_test(line_match.group(1), int(line_match.group(3)), line_match.group(2) in ['Dubious', 'Failed'])
+            return
+
+
+
+    # result()
+    #
+    # return all recorded timings
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - dictionary with all suites, only suites with tests are included
+    def result(self):
+        return dict([(name, suite) for name, suite in self.suites.items()
+                     if (len(suite['tests']) > 0 or len(suite['failed']) > 0)])
@@ -0,0 +1,352 @@
+import os
+import re
+import time
+import shutil
+import logging
+import tempfile
+import threading
+import subprocess
+
+
+class Repository:
+
+    def __init__(self, config):
+        self.config = config
+        # all jobs share one bare mirror of the repository in the cache directory
+        self.mirror_dir = os.path.join(config.get('cache-dir'), config.create_hashname(config.get('repository-url')) + '.git')
+        # serializes all operations which modify the mirror itself
+        self.mirror_lock = threading.Lock()
+        # only one fetch runs at a time, all other jobs wait for the result
+        self.fetch_condition = threading.Condition()
+        self.fetch_in_progress = False
+        self.fetch_generation = 0
+        self.fetch_result = False
+        # the timestamp survives a restart of the tool
+        self.fetch_stamp = os.path.join(self.mirror_dir, 'testtool_last_fetch')
+
+
+
+    # run_git()
+    #
+    # run a git command
+    #
+    # parameter:
+    #  - self
+    #  - list with git arguments
+    #  - working directory (optional)
+    #  - environment (optional)
+    #  - True if a failure is expected, and not an error (optional)
+    # return:
+    #  - list with return code and output (stdout and stderr)
+    def run_git(self, args, cwd = None, env = None, quiet = False):
+        cmd = [self.config.get('git-bin')] + args
+        logging.debug("git: " + ' '.join(cmd))
+        proc = subprocess.Popen(cmd, cwd = cwd, env = env, stdout = subprocess.PIPE, stderr = subprocess.STDOUT)
+        output = proc.communicate()[0].decode('utf-8', 'replace')
+        if (proc.returncode != 0 and quiet is False):
+            logging.error("git command failed (" + str(proc.returncode) + "): " + ' '.join(cmd))
+            logging.error(output)
+
+        return [proc.returncode, output]
+
+
+
+    # git_mirror()
+    #
+    # run a git command against the mirror
+    #
+    # parameter:
+    #  - self
+    #  - list with git arguments
+    #  - environment (optional)
+    #  - True if a failure is expected, and not an error (optional)
+    # return:
+    #  - list with return code and output
+    def git_mirror(self, args, env = None, quiet = False):
+        return self.run_git(['--git-dir=' + self.mirror_dir] + args, env = env, quiet = quiet)
+
+
+
+    # mirror_exists()
+    #
+    # verify if the mirror is already cloned
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - True/False
+    def mirror_exists(self):
+        if (os.path.isfile(os.path.join(self.mirror_dir, 'HEAD'))):
+            return True
+
+        return False
+
+
+
+    # init_mirror()
+    #
+    # clone the mirror, if it does not yet exist
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - True/False
+    def init_mirror(self):
+        with self.mirror_lock:
+            if (self.mirror_exists() is True):
+                return True
+
+            logging.info("cloning " + self.config.get('repository-url') + " into " + self.mirror_dir)
+            # a failed clone leaves an unusable directory behind
+            shutil.rmtree(self.mirror_dir, ignore_errors=True)
+            args = ['clone', '--mirror']
+            if (self.config.get('git-depth') > 0):
+                args += ['--depth', str(self.config.get('git-depth')), '--no-single-branch']
+            args += [self.config.get('repository-url'), self.mirror_dir]
+            ret = self.run_git(args)
+            if (ret[0] != 0):
+                shutil.rmtree(self.mirror_dir, ignore_errors=True)
+                return False
+
+            # a fresh clone counts as fetch
+            with open(self.fetch_stamp, 'w') as fh:
+                fh.write(str(time.time()) + "\n")
+
+            # worktrees of deleted jobs are cleaned up on every start
+            self.git_mirror(['worktree', 'prune'])
+
+        return True
+
+
+
+    # last_fetch()
+    #
+    # time of the last successful fetch
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - timestamp, or 0 if the mirror was never updated
+    def last_fetch(self):
+        try:
+            return os.path.getmtime(self.fetch_stamp)
+        except OSError:
+            return 0
+
+
+
+    # update_mirror()
+    #
+    # fetch new commits into the mirror, if the last fetch is too old
+    #
+    # parameter:
+    #  - self
+    #  - True if the mirror must be updated, no matter the last fetch (optional)
+    # return:
+    #  - True/False
+    # note:
+    #  - the mirror is updated at most once within 'git-fetch-interval' seconds
+    #  - if a fetch is already running, wait for it and use the result
+    def update_mirror(self, force = False):
+        with self.fetch_condition:
+            if (self.fetch_in_progress is True):
+                generation = self.fetch_generation
+                logging.debug("waiting for running fetch")
+                while (self.fetch_generation == generation):
+                    self.fetch_condition.wait()
+                return self.fetch_result
+            if (force is False and time.time() - self.last_fetch() < self.config.get('git-fetch-interval')):
+                logging.debug("mirror is fresh, last fetch " + str(int(time.time() - self.last_fetch())) + "s ago")
+                return True
+            self.fetch_in_progress = True
+
+        result = False
+        try:
+            logging.info("updating mirror " + self.mirror_dir)
+            args = ['fetch', '--prune']
+            if (self.config.get('git-depth') > 0):
+                args += ['--depth', str(self.config.get('git-depth'))]
+            args += ['origin']
+            ret = self.git_mirror(args)
+            if (ret[0] == 0):
+                with open(self.fetch_stamp, 'w') as fh:
+                    fh.write(str(time.time()) + "\n")
+                result = True
+        finally:
+            with self.fetch_condition:
+                self.fetch_result = result
+                self.fetch_in_progress = False
+                self.fetch_generation += 1
+                self.fetch_condition.notify_all()
+
+        return result
+
+
+
+    # branch_revision()
+    #
+    # return the current revision of a branch in the mirror
+    #
+    # parameter:
+    #  - self
+    #  - branch name prefix
+    # return:
+    #  - revision, or False
+    def branch_revision(self, prefix):
+        branch = self.branch_name(prefix)
+        if (branch is False):
+            return False
+        ret = self.git_mirror(['rev-parse', 'refs/heads/' + branch])
+        if (ret[0] != 0):
+            return False
+
+        return ret[1].strip()
+
+
+
+    # branch_name()
+    #
+    # find the branch name for a branch name prefix
+    #
+    # parameter:
+    #  - self
+    #  - branch name prefix (from "commitfest_test_pg_versions")
+    # return:
+    #  - branch name, or False
+    # note:
+    #  - 'master' is used as is, the back branches are named like 'REL9_6_STABLE'
+    def branch_name(self, prefix):
+        ret = self.git_mirror(['for-each-ref', '--format=%(refname:short)', 'refs/heads/'])
+        if (ret[0] != 0):
+            return False
+        branches = ret[1].split()
+
+        if (prefix in branches):
+            return prefix
+        if (prefix + '_STABLE' in branches):
+            return prefix + '_STABLE'
+        for branch in branches:
+            if (re.match(re.escape(prefix) + r'_', branch)):
+                return branch
+
+        logging.error("no branch found for prefix: " + prefix)
+        return False
+
+
+
+    # add_worktree()
+    #
+    # create a worktree of a branch, for a single job
+    #
+    # parameter:
+    #  - self
+    #  - directory for the worktree (must not exist)
+    #  - branch name prefix
+    #  - revision (optional, default is the top of the branch)
+    # return:
+    #  - True/False
+    # note:
+    #  - the worktree is detached, multiple jobs can use the same branch
+    #  - the objects are shared with the mirror, only the checkout itself
+    #    needs space in the build directory
+    def add_worktree(self, dir, prefix, revision = None):
+        if (revision is None):
+            revision = self.branch_name(prefix)
+            if (revision is False):
+                return False
+
+        # only the metadata is created with the lock, jobs check out in parallel
+        with self.mirror_lock:
+            ret = self.git_mirror(['worktree', 'add', '--no-checkout', '--detach', dir, revision])
+        if (ret[0] != 0):
+            return False
+        ret = self.run_git(['reset', '--hard', '--quiet'], cwd = dir)
+        if (ret[0] != 0):
+            return False
+
+        logging.debug("worktree for " + revision + ": " + dir)
+        return True
+
+
+
+    # prune_worktrees()
+    #
+    # remove the metadata of worktrees whose directory is gone
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    # note:
+    #  - build directories are removed by the cleanup, the worktree
+    #    metadata in the mirror stays behind until it is pruned
+    def prune_worktrees(self):
+        with self.mirror_lock:
+            if (self.mirror_exists() is True):
+                self.git_mirror(['worktree', 'prune'])
+
+
+
+    # remove_worktree_metadata()
+    #
+    # turn a worktree into a plain directory, the files are kept
+    #
+    # parameter:
+    #  - self
+    #  - directory of the worktree
+    # return:
+    #  none
+    def remove_worktree_metadata(self, dir):
+        with self.mirror_lock:
+            if (os.path.isfile(os.path.join(dir, '.git'))):
+                os.remove(os.path.join(dir, '.git'))
+            self.git_mirror(['worktree', 'prune'])
+
+
+
+    # apply_check()
+    #
+    # verify if patches apply to a revision, without a checkout
+    #
+    # parameter:
+    #  - self
+    #  - revision
+    #  - list with patch files
+    # return:
+    #  - list with return code and output
+    # note:
+    #  - the revision is read into a temporary index, and the patches are
+    #    applied to the index only, the mirror itself is not modified
+    def apply_check(self, revision, files):
+        fd, index = tempfile.mkstemp(prefix = 'testtool_index_')
+        os.close(fd)
+        os.remove(index)
+        env = os.environ.copy()
+        env['GIT_INDEX_FILE'] = index
+        try:
+            ret = self.git_mirror(['read-tree', revision], env = env)
+            if (ret[0] != 0):
+                return ret
+            return self.git_mirror(['apply', '--cached', '--check', '--whitespace=nowarn'] + files, env = env, quiet = True)
+        finally:
+            if (os.path.isfile(index)):
+                os.remove(index)
+
+
+
+    # changed_files()
+    #
+    # return all files which changed between two revisions
+    #
+    # parameter:
+    #  - self
+    #  - old revision
+    #  - new revision
+    # return:
+    #  - list with filenames, or False
+    def changed_files(self, old_revision, new_revision):
+        ret = self.git_mirror(['diff', '--name-only', old_revision, new_revision], quiet = True)
+        if (ret[0] != 0):
+            return False
+
+        return [line for line in ret[1].splitlines() if (len(line) > 0)]
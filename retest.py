@@ -0,0 +1,136 @@
+import logging
+import threading
+from impact import Impact
+
+
+class Retest:
+
+    def __init__(self, config, database, repository, patch):
+        self.config = config
+        self.database = database
+        self.repository = repository
+        self.patch = patch
+        self.impact = Impact()
+        # see "commitfest_test_patch".priority
+        self.priority_affected = 10
+        self.priority_sweep = -10
+        self.thread = None
+
+
+
+    # maintain()
+    #
+    # queue re-tests in the background
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    # note:
+    #  - comparing revisions and reading all recent patches takes a while,
+    #    the poll loop does not wait for it
+    #  - a new run only starts once the previous run is finished
+    def maintain(self):
+        if (self.thread is None or self.thread.is_alive() is False):
+            self.thread = threading.Thread(target = self.run, name = 'retest', daemon = True)
+            self.thread.start()
+
+
+
+    # run()
+    #
+    # queue re-tests for the active branches
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def run(self):
+        try:
+            self.check_versions()
+        except Exception:
+            logging.exception("re-test failed")
+
+
+
+    # check_versions()
+    #
+    # queue re-tests for the active branches
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    # note:
+    #  - if a branch moved, only the patches affected by the new commits
+    #    are queued again, with a high priority
+    #  - all other recent patches are queued periodically, with a low priority
+    def check_versions(self):
+        versions = self.database.retest_versions()
+        if (len(versions) == 0):
+            return
+        if (self.repository.update_mirror() is False):
+            return
+
+        for version in versions:
+            revision = self.repository.branch_revision(version['branch_name_prefix'])
+            if (revision is False):
+                continue
+            if (revision != version['retest_revision']):
+                if (self.database.advance_retest_revision(version['id'], version['retest_revision'], revision) is True):
+                    # the first revision is only recorded
+                    if (len(version['retest_revision']) > 0):
+                        self.retest_affected(version, revision)
+            if (version['sweep_due'] is True):
+                if (self.database.start_retest_sweep(version['id']) is True):
+                    self.retest_all(version)
+
+
+
+    # retest_affected()
+    #
+    # queue the patches which are affected by new commits
+    #
+    # parameter:
+    #  - self
+    #  - branch (from retest_versions())
+    #  - new revision
+    # return:
+    #  none
+    def retest_affected(self, version, revision):
+        changed = self.repository.changed_files(version['retest_revision'], revision)
+        if (changed is False):
+            # the old revision is gone, the sweep will catch up
+            logging.warning("re-test: cannot compare " + version['branch_name_prefix'] + " " + version['retest_revision'] + " with " + revision)
+            return
+
+        affected = []
+        tests = self.database.recent_tests(version['id'])
+        for test in tests:
+            files = self.patch.fetch_patchset(test['patches'])
+            if (files is False):
+                continue
+            touched = self.patch.touched_files(files)
+            self.patch.release(files)
+            if (self.impact.affected(changed, touched) is True):
+                affected.append(test['id'])
+
+        logging.info("re-test: " + version['branch_name_prefix'] + " moved to " + revision + ", " + str(len(changed)) + " files changed, " +
+                     str(len(affected)) + " of " + str(len(tests)) + " patches affected")
+        self.database.requeue_tests(affected, self.priority_affected)
+
+
+
+    # retest_all()
+    #
+    # queue all recent patches of a branch
+    #
+    # parameter:
+    #  - self
+    #  - branch (from retest_versions())
+    # return:
+    #  none
+    def retest_all(self, version):
+        tests = self.database.recent_tests(version['id'])
+        logging.info("re-test: sweep " + version['branch_name_prefix'] + ", " + str(len(tests)) + " patches")
+        self.database.requeue_tests([test['id'] for test in tests], self.priority_sweep)
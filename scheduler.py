@@ -0,0 +1,283 @@
+import os
+import time
+import logging
+import threading
+import contextlib
+import multiprocessing
+from time import localtime, strftime
+
+
+class Scheduler:
+
+    def __init__(self, config):
+        self.config = config
+        # jobs in CPU heavy stages (configure, make, install, tests)
+        self.number_jobs = int(config.get('number-parallel-jobs'))
+        # additional jobs in I/O stages (download, git update, patch),
+        # they prepare the next jobs while the others compile
+        self.number_io_jobs = int(config.get('number-io-jobs'))
+        self.cpu_tokens = threading.Semaphore(self.number_jobs)
+        self.cpu_count = multiprocessing.cpu_count()
+        # seconds between two queue lookups, if nothing else wakes up the scheduler
+        self.poll_interval = int(config.get('poll-interval'))
+        self.running = {}
+        self.build_dirs = {}
+        self.lock = threading.Lock()
+        self.wakeup_event = threading.Event()
+        self.stop_event = threading.Event()
+
+
+
+    # make_jobs()
+    #
+    # number of parallel 'make' processes for a single job
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - number of 'make' jobs
+    # note:
+    #  - the CPUs are split evenly between all CPU tokens, every job
+    #    gets at least one CPU
+    def make_jobs(self):
+        return max(1, self.cpu_count // self.number_jobs)
+
+
+
+    # make_parallel_flags()
+    #
+    # commandline flags for running 'make' in parallel
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - list with 'make' flags
+    # note:
+    #  - the load limit is shared by all running jobs: 'make' does not start
+    #    new compiler processes while the load is above the number of CPUs,
+    #    this keeps the machine busy but not overloaded, even if the jobs
+    #    are in different stages
+    def make_parallel_flags(self):
+        return ['-j', str(self.make_jobs()), '-l', str(self.cpu_count)]
+
+
+
+    # free_slots()
+    #
+    # number of job slots which are currently available
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - number of free slots
+    def free_slots(self):
+        with self.lock:
+            return max(0, self.number_jobs + self.number_io_jobs - len(self.running))
+
+
+
+    # cpu_slot()
+    #
+    # wait for a CPU token, and hold it for the duration of the block
+    #
+    # parameter:
+    #  - self
+    #  - job
+    # return:
+    #  - context manager
+    # note:
+    #  - only the CPU heavy stages need a token, the I/O stages of other
+    #    jobs run in the meantime
+    @contextlib.contextmanager
+    def cpu_slot(self, job):
+        start_time = time.time()
+        self.cpu_tokens.acquire()
+        waited = time.time() - start_time
+        if (waited >= 1):
+            logging.debug("job " + str(job['id']) + " waited " + str(int(waited)) + "s for a CPU token")
+        try:
+            yield
+        finally:
+            self.cpu_tokens.release()
+
+
+
+    # running_jobs()
+    #
+    # return the ids of all running jobs
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - list with job ids
+    def running_jobs(self):
+        with self.lock:
+            return list(self.running.keys())
+
+
+
+    # running_build_dirs()
+    #
+    # return the build directories of all running jobs
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - list with directory names
+    def running_build_dirs(self):
+        with self.lock:
+            return list(self.build_dirs.values())
+
+
+
+    # create_build_dir()
+    #
+    # create a new build directory for a job
+    #
+    # parameter:
+    #  - self
+    #  - job
+    # return:
+    #  - directory name
+    # note:
+    #  - the name matches the pattern used by Cleanup.builds()
+    def create_build_dir(self, job):
+        dir = os.path.join(self.config.get('build-dir'), strftime("%Y-%m-%d_%H%M%S", localtime()) + '_' + str(job['id']))
+        os.mkdir(dir)
+        # the cleanup keeps the last builds of every branch
+        with open(os.path.join(dir, 'testtool_branch'), 'w') as fh:
+            fh.write(job['branch_name_prefix'] + "\n")
+        logging.debug("build dir for job " + str(job['id']) + ": " + dir)
+        job['build-dir'] = dir
+
+        return dir
+
+
+
+    # start_job()
+    #
+    # start a job in a new worker thread
+    #
+    # parameter:
+    #  - self
+    #  - job
+    #  - function which runs the job
+    # return:
+    #  none
+    def start_job(self, job, run_job):
+        # a job resumed from the journal keeps its build directory
+        if not ('build-dir' in job):
+            self.create_build_dir(job)
+        thread = threading.Thread(target = self.worker, args = (job, run_job),
+                                  name = 'job-' + str(job['id']))
+        thread.daemon = True
+        with self.lock:
+            self.running[job['id']] = thread
+            self.build_dirs[job['id']] = job['build-dir']
+        logging.info("start job " + str(job['id']) + " (" + str(self.free_slots()) + " free slots)")
+        thread.start()
+
+
+
+    # worker()
+    #
+    # run a single job, free the slot afterwards
+    #
+    # parameter:
+    #  - self
+    #  - job
+    #  - function which runs the job
+    # return:
+    #  none
+    def worker(self, job, run_job):
+        start_time = time.time()
+        try:
+            run_job(job, self)
+        except Exception:
+            logging.exception("job " + str(job['id']) + " failed")
+        finally:
+            with self.lock:
+                del self.running[job['id']]
+                del self.build_dirs[job['id']]
+            logging.info("job " + str(job['id']) + " finished after " + str(int(time.time() - start_time)) + "s")
+            # a slot is free, look for more work
+            self.wakeup_event.set()
+
+
+
+    # wakeup()
+    #
+    # wake up the main loop, to look for new jobs
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def wakeup(self):
+        self.wakeup_event.set()
+
+
+
+    # stop()
+    #
+    # stop the main loop, running jobs are not interrupted
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def stop(self):
+        self.stop_event.set()
+        self.wakeup_event.set()
+
+
+
+    # run()
+    #
+    # main loop: fill all free slots with jobs from the queue
+    #
+    # parameter:
+    #  - self
+    #  - function which returns up to n new jobs
+    #  - function which runs a job
+    # return:
+    #  none
+    def run(self, fetch_jobs, run_job):
+        logging.info("running up to " + str(self.number_jobs) + " parallel builds, " + str(self.make_jobs()) + " make jobs each, " + str(self.cpu_count) + " CPUs, plus " + str(self.number_io_jobs) + " jobs in I/O stages")
+        while (self.stop_event.is_set() is False):
+            # clear before looking for work, a job finishing in the meantime
+            # will set the event again
+            self.wakeup_event.clear()
+            # also without free slots, the heartbeats keep the claims alive
+            try:
+                jobs = fetch_jobs(self.free_slots())
+            except Exception:
+                # usually the database is not reachable, try again with the next poll
+                logging.exception("fetching jobs failed")
+                jobs = []
+            for job in jobs:
+                self.start_job(job, run_job)
+
+            self.wakeup_event.wait(self.poll_interval)
+
+        self.wait()
+
+
+
+    # wait()
+    #
+    # wait until all running jobs are finished
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def wait(self):
+        while True:
+            with self.lock:
+                threads = list(self.running.values())
+            if (len(threads) == 0):
+                break
+            logging.info("waiting for " + str(len(threads)) + " running job(s)")
+            for thread in threads:
+                thread.join()
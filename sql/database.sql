@@ -24,7 +24,12 @@ CREATE TABLE "public"."commitfest_test_pg_versions" (
     name                     TEXT                    NOT NULL UNIQUE,
     branch_name_prefix         TEXT                    NOT NULL UNIQUE,
     active                   BOOLEAN                 NOT NULL,
-    active_by_default        BOOLEAN                 NOT NULL
+    active_by_default        BOOLEAN                 NOT NULL,
+    -- last revision of the branch the test hosts compared the patches with
+    -- patches affected by newer commits are re-tested
+    retest_revision          TEXT                    NOT NULL DEFAULT '',
+    -- last time all recent patches were re-queued for the branch
+    ts_retest_sweep          TIMESTAMPTZ             NULL
 );
 INSERT INTO "public"."commitfest_test_pg_versions"
             (name, branch_name_prefix, active, active_by_default)
@@ -37,16 +42,16 @@ INSERT INTO "public"."commitfest_test_pg_versions"
             ('9.2', 'REL9_2', true, false),
             ('9.1', 'REL9_1', true, false),
             ('9.0', 'REL9_0', true, false),
-            ('8.4', 'REL8_4', false),
-            ('8.3', 'REL8_3', false),
-            ('8.2', 'REL8_2', false),
-            ('8.1', 'REL8_1', false),
-            ('8.0', 'REL8_0', false),
-            ('7.4', 'REL7_4', false),
-            ('7.3', 'REL7_3', false),
-            ('7.2', 'REL7_2', false),
-            ('7.1', 'REL7_1', false),
-            ('7.0', 'REL7_0', false);
+            ('8.4', 'REL8_4', false, false),
+            ('8.3', 'REL8_3', false, false),
+            ('8.2', 'REL8_2', false, false),
+            ('8.1', 'REL8_1', false, false),
+            ('8.0', 'REL8_0', false, false),
+            ('7.4', 'REL7_4', false, false),
+            ('7.3', 'REL7_3', false, false),
+            ('7.2', 'REL7_2', false, false),
+            ('7.1', 'REL7_1', false, false),
+            ('7.0', 'REL7_0', false, false);
 
 
 -- all supported platforms
@@ -92,12 +97,36 @@ CREATE TABLE "public"."commitfest_test_patch" (
                                                      -- aborted: something happened which is buildfarm related
                                                      -- failed: patchset failed to compile or run tests
                                                      -- success: everything passed
-                                                     CHECK(result IN ('queued', 'aborted', 'failed', 'success'))
+                                                     CHECK(state IN ('queued', 'aborted', 'failed', 'success'))
                                                      DEFAULT 'queued',
     -- the tool will update this column to the revision used during the test
     -- especially useful so that the website does not have to specify a revision while inserting the job
-    git_revision             TEXT                    NOT NULL DEFAULT ''
+    git_revision             TEXT                    NOT NULL DEFAULT '',
+    -- the test host which is working on the job, set together with ts_started
+    claimed_by               TEXT                    NULL,
+    -- updated regularly by the test host while working on the job
+    -- a job without heartbeat for too long is returned into the queue
+    ts_heartbeat             TIMESTAMPTZ             NULL,
+    -- the patches apply to the branch, checked before the job is built
+    apply_checked            BOOLEAN                 NOT NULL DEFAULT FALSE,
+    -- jobs with a higher priority are started first
+    --  10: re-test, the branch changed in an area touched by the patch
+    --   0: queued by the website
+    -- -10: periodic re-test of all recent patches
+    priority                 INTEGER                 NOT NULL DEFAULT 0,
+    -- size of the unpacked patches in bytes, set once the patches are downloaded
+    -- used to predict the duration of the job
+    patch_size               BIGINT                  NULL
 );
+-- test hosts only look at jobs which are not yet started
+CREATE INDEX commitfest_test_patch_queued
+          ON "public"."commitfest_test_patch"
+             (platform, priority DESC, ts_added)
+       WHERE ts_started IS NULL;
+-- recent tests of a branch, for re-tests
+CREATE INDEX commitfest_test_patch_recent
+          ON "public"."commitfest_test_patch"
+             (pg_version, ts_added);
 
 
 
@@ -124,10 +153,69 @@ CREATE TABLE "public"."commitfest_patch" (
 
 
 
+-- test hosts LISTEN on the "commitfest_test_patch" channel
+-- a job can be claimed once it has patches, notify on both tables
+CREATE FUNCTION "public"."commitfest_test_patch_notify"()
+        RETURNS TRIGGER
+AS $$
+BEGIN
+    -- identical notifications in one transaction are delivered only once
+    NOTIFY "commitfest_test_patch";
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER commitfest_test_patch_notify
+         AFTER INSERT
+            ON "public"."commitfest_test_patch"
+           FOR EACH STATEMENT
+       EXECUTE PROCEDURE "public"."commitfest_test_patch_notify"();
+-- released and expired claims are available again
+CREATE TRIGGER commitfest_test_patch_notify_release
+         AFTER UPDATE OF ts_started
+            ON "public"."commitfest_test_patch"
+           FOR EACH ROW
+          WHEN (OLD.ts_started IS NOT NULL AND NEW.ts_started IS NULL)
+       EXECUTE PROCEDURE "public"."commitfest_test_patch_notify"();
+CREATE TRIGGER commitfest_patch_notify
+         AFTER INSERT
+            ON "public"."commitfest_patch"
+           FOR EACH STATEMENT
+       EXECUTE PROCEDURE "public"."commitfest_test_patch_notify"();
+
+
+
+-- all test hosts, updated every time a host looks for new jobs
+CREATE TABLE "public"."commitfest_test_hosts" (
+    name                     TEXT                    NOT NULL PRIMARY KEY,
+    ts_heartbeat             TIMESTAMPTZ             NOT NULL
+                                                     DEFAULT NOW(),
+    -- job slots which are not in use
+    free_slots               INTEGER                 NOT NULL DEFAULT 0
+);
+
+-- warm caches of the test hosts, per branch
+-- jobs prefer a host which already has a pristine build of the branch
+CREATE TABLE "public"."commitfest_test_host_caches" (
+    host                     TEXT                    NOT NULL
+                                                     REFERENCES "public"."commitfest_test_hosts"(name)
+                                                     ON DELETE CASCADE,
+    branch_name_prefix       TEXT                    NOT NULL,
+    -- revision of the branch in the mirror of the host
+    revision                 TEXT                    NOT NULL DEFAULT '',
+    -- a pristine build of this revision exists
+    snapshot                 BOOLEAN                 NOT NULL DEFAULT FALSE,
+    -- a compiler cache for the branch exists
+    ccache                   BOOLEAN                 NOT NULL DEFAULT FALSE,
+    PRIMARY KEY (host, branch_name_prefix)
+);
+
+
+
 -- overall results for every test
 -- use an extra table to keep "commitfest_test_patch" small
+-- partitioned by month, see "commitfest_test_create_partitions()"
 CREATE TABLE "public"."commitfest_test_results" (
-    id                       BIGSERIAL               NOT NULL PRIMARY KEY,
+    id                       BIGSERIAL               NOT NULL,
     test_id                  BIGINT                  NOT NULL
                                                      REFERENCES "public"."commitfest_test_patch"(id),
     repository               TEXT                    NOT NULL,
@@ -150,6 +238,8 @@ CREATE TABLE "public"."commitfest_test_results" (
     time_make                REAL                    NOT NULL,
     time_install             REAL                    NOT NULL,
     time_tests               REAL                    NOT NULL,
+    -- creating the worktree, or building and copying the snapshot
+    time_prepare_source      REAL,
     result_git_update        INTEGER,
     result_patch             INTEGER,
     result_configure         INTEGER,
@@ -159,8 +249,31 @@ CREATE TABLE "public"."commitfest_test_results" (
     -- only known if install passed
     pg_version               TEXT,
     pg_version_num           TEXT,
-    pg_version_str           TEXT
-);
+    pg_version_str           TEXT,
+    -- compiler cache statistics for the make stage, if ccache is enabled
+    ccache_hits              INTEGER,
+    ccache_misses            INTEGER,
+    -- duration (ms) of every test, and the failed tests, per suite
+    -- {"src/test/regress": {"time": 1234, "tests": {"select": 150, ...}, "failed": [...]}, ...}
+    test_timings             JSONB,
+    -- hash of patch contents, revision, branch, platform and build options
+    result_key               TEXT,
+    -- the test was not run again, the result is copied from this test
+    -- no foreign key, the key of the partitioned table includes start_time
+    reused_from              BIGINT                  NULL,
+    PRIMARY KEY (id, start_time)
+) PARTITION BY RANGE (start_time);
+CREATE INDEX commitfest_test_results_test_id
+          ON "public"."commitfest_test_results"
+             (test_id);
+-- identical tests are looked up by the key
+CREATE INDEX commitfest_test_results_result_key
+          ON "public"."commitfest_test_results"
+             (result_key)
+       WHERE result_key IS NOT NULL;
+-- results outside of the monthly partitions
+CREATE TABLE "public"."commitfest_test_results_default"
+             PARTITION OF "public"."commitfest_test_results" DEFAULT;
 
 
 
@@ -168,11 +281,12 @@ CREATE TABLE "public"."commitfest_test_results" (
 -- use an extra table to keep "commitfest_test_results" reasonable small
 -- this table will contain all the output from the different stages
 -- this table might contain sensitive information
+-- partitioned by month, old partitions are archived into files and dropped
 CREATE TABLE "public"."commitfest_test_data" (
-    id                       BIGSERIAL               NOT NULL PRIMARY KEY,
-    test_id                  BIGINT                  NOT NULL
-                                                     REFERENCES "public"."commitfest_test_results"(id)
-                                                     ON DELETE CASCADE,
+    id                       BIGSERIAL               NOT NULL,
+    test_id                  BIGINT                  NOT NULL,
+    -- same as "commitfest_test_results".start_time
+    start_time               TIMESTAMPTZ             NOT NULL,
     patches                  TEXT                    NOT NULL DEFAULT '',
     errorstr                 TEXT                    NOT NULL DEFAULT '',
     stage_git_update         TEXT                    NOT NULL DEFAULT '',
@@ -180,8 +294,86 @@ CREATE TABLE "public"."commitfest_test_data" (
     stage_configure          TEXT                    NOT NULL DEFAULT '',
     stage_make               TEXT                    NOT NULL DEFAULT '',
     stage_install            TEXT                    NOT NULL DEFAULT '',
-    stage_tests              TEXT                    NOT NULL DEFAULT ''
-);
+    stage_tests              TEXT                    NOT NULL DEFAULT '',
+    -- the stage columns only hold the beginning and the end of the output
+    -- the full output is kept compressed on the test host: "host:directory"
+    log_location             TEXT                    NOT NULL DEFAULT '',
+    PRIMARY KEY (id, start_time),
+    FOREIGN KEY (test_id, start_time)
+     REFERENCES "public"."commitfest_test_results"(id, start_time)
+      ON DELETE CASCADE
+) PARTITION BY RANGE (start_time);
+CREATE INDEX commitfest_test_data_test_id
+          ON "public"."commitfest_test_data"
+             (test_id);
+-- stage logs outside of the monthly partitions, never archived
+CREATE TABLE "public"."commitfest_test_data_default"
+             PARTITION OF "public"."commitfest_test_data" DEFAULT;
+
+
+
+-- create the monthly partitions for results and stage logs
+-- the current month and "ahead" months, the test hosts call this once a day
+-- a partition is named after the table and the month: "..._2020_01"
+-- the months are in UTC
+CREATE FUNCTION "public"."commitfest_test_create_partitions"(ahead INTEGER)
+        RETURNS SETOF TEXT
+AS $$
+DECLARE
+    month_start              TIMESTAMP;
+    parent                   TEXT;
+    partition                TEXT;
+BEGIN
+    -- all test hosts call this, one at a time
+    PERFORM pg_advisory_xact_lock(hashtext('commitfest_test_partitions'));
+    FOR i IN 0..ahead LOOP
+        month_start := date_trunc('month', NOW() AT TIME ZONE 'UTC') + i * INTERVAL '1 month';
+        -- the stage logs reference the results, create the results first
+        FOREACH parent IN ARRAY ARRAY['commitfest_test_results', 'commitfest_test_data'] LOOP
+            partition := parent || '_' || to_char(month_start, 'YYYY_MM');
+            IF to_regclass('"public".' || quote_ident(partition)) IS NULL THEN
+                EXECUTE format('CREATE TABLE "public".%I PARTITION OF "public".%I FOR VALUES FROM (%L) TO (%L)',
+                               partition, parent,
+                               month_start::TEXT || '+00',
+                               (month_start + INTERVAL '1 month')::TEXT || '+00');
+                RETURN NEXT partition;
+            END IF;
+        END LOOP;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- list the monthly partitions with stage logs
+CREATE FUNCTION "public"."commitfest_test_data_partitions"()
+        RETURNS TABLE (name TEXT, month_start TIMESTAMPTZ, month_end TIMESTAMPTZ)
+AS $$
+    SELECT c.relname::TEXT,
+           to_date(substring(c.relname FROM '(\d{4}_\d{2})$'), 'YYYY_MM')::TIMESTAMP AT TIME ZONE 'UTC',
+           (to_date(substring(c.relname FROM '(\d{4}_\d{2})$'), 'YYYY_MM') + INTERVAL '1 month') AT TIME ZONE 'UTC'
+      FROM pg_inherits i
+      JOIN pg_class c
+        ON c.oid = i.inhrelid
+     WHERE i.inhparent = '"public"."commitfest_test_data"'::REGCLASS
+       AND c.relname ~ '^commitfest_test_data_\d{4}_\d{2}$';
+$$ LANGUAGE sql STABLE;
+
+-- detach and drop a monthly partition with stage logs, after it is archived
+-- dropping a partition only removes the files, there is no DELETE and no VACUUM
+CREATE FUNCTION "public"."commitfest_test_drop_data_partition"(partition TEXT)
+        RETURNS VOID
+AS $$
+BEGIN
+    IF NOT EXISTS (SELECT 1
+                     FROM "public"."commitfest_test_data_partitions"() p
+                    WHERE p.name = partition) THEN
+        RAISE EXCEPTION 'not a monthly partition of commitfest_test_data: %', partition;
+    END IF;
+    EXECUTE format('ALTER TABLE "public"."commitfest_test_data" DETACH PARTITION "public".%I', partition);
+    EXECUTE format('DROP TABLE "public".%I', partition);
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT "public"."commitfest_test_create_partitions"(2);
 
 
 
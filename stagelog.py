@@ -0,0 +1,146 @@
+import os
+import gzip
+import time
+import logging
+import subprocess
+
+
+class StageLog:
+
+    def __init__(self, config, filename):
+        self.config = config
+        # the full output goes compressed to disk, only head and tail stay in memory
+        self.filename = filename
+        self.head_size = 32 * 1024
+        self.tail_size = 32 * 1024
+        self.chunk_size = 64 * 1024
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.size = 0
+        self.fh = gzip.open(filename, 'wb', compresslevel = 6)
+
+
+
+    # write()
+    #
+    # add output to the log
+    #
+    # parameter:
+    #  - self
+    #  - output (bytes or string)
+    # return:
+    #  none
+    def write(self, data):
+        if (not isinstance(data, bytes)):
+            data = data.encode('utf-8')
+        self.fh.write(data)
+        self.size += len(data)
+
+        if (len(self.head) < self.head_size):
+            missing = self.head_size - len(self.head)
+            self.head += data[:missing]
+            data = data[missing:]
+        if (len(data) > 0):
+            self.tail += data
+            if (len(self.tail) > self.tail_size):
+                del self.tail[:len(self.tail) - self.tail_size]
+
+
+
+    # run()
+    #
+    # run a command, and stream the output into the log
+    #
+    # parameter:
+    #  - self
+    #  - list with command and arguments
+    #  - working directory
+    #  - environment (optional)
+    #  - function which is called for every line of output (optional)
+    # return:
+    #  - return code
+    def run(self, cmd, cwd, env = None, line_callback = None):
+        logging.debug("run: " + ' '.join(cmd))
+        self.write("$ " + ' '.join(cmd) + "\n")
+        start_time = time.time()
+        proc = subprocess.Popen(cmd, cwd = cwd, env = env, stdin = subprocess.DEVNULL,
+                                stdout = subprocess.PIPE, stderr = subprocess.STDOUT)
+        fd = proc.stdout.fileno()
+        partial = b''
+        while True:
+            data = os.read(fd, self.chunk_size)
+            if (len(data) == 0):
+                break
+            self.write(data)
+            if (line_callback is not None):
+                lines = (partial + data).split(b'\n')
+                partial = lines.pop()
+                for line in lines:
+                    line_callback(line.decode('utf-8', 'replace'))
+                # no line is held in memory without limit
+                if (len(partial) > self.chunk_size):
+                    line_callback(partial.decode('utf-8', 'replace'))
+                    partial = b''
+        if (line_callback is not None and len(partial) > 0):
+            line_callback(partial.decode('utf-8', 'replace'))
+        proc.stdout.close()
+        proc.wait()
+        self.write("# exit code " + str(proc.returncode) + " after " + str(round(time.time() - start_time, 1)) + "s\n")
+
+        return proc.returncode
+
+
+
+    # close()
+    #
+    # finish the log file
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def close(self):
+        if (self.fh is not None):
+            self.fh.close()
+            self.fh = None
+
+
+
+    # contains()
+    #
+    # verify if the output contains a text
+    #
+    # parameter:
+    #  - self
+    #  - text
+    #  - only search the output after this position (optional, from 'size')
+    # return:
+    #  - True/False
+    # note:
+    #  - only head and tail are searched, short output is only in the head
+    def contains(self, text, since = 0):
+        tail_start = self.size - len(self.tail)
+        output = bytes(self.head[since:]) + bytes(self.tail[max(0, since - tail_start):])
+        if (text.encode('utf-8') in output):
+            return True
+
+        return False
+
+
+
+    # excerpt()
+    #
+    # return the beginning and the end of the log
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - string with head and tail of the output, and a reference to the full log
+    def excerpt(self):
+        skipped = self.size - len(self.head) - len(self.tail)
+        if (skipped <= 0):
+            return (bytes(self.head) + bytes(self.tail)).decode('utf-8', 'replace')
+
+        return bytes(self.head).decode('utf-8', 'replace') + \
+               "\n[... " + self.config.human_size(skipped) + " skipped, full log: " + self.filename + " ...]\n" + \
+               bytes(self.tail).decode('utf-8', 'replace')
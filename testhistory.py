@@ -0,0 +1,114 @@
+import os
+import time
+import logging
+import sqlite3
+import threading
+
+
+class TestHistory:
+
+    def __init__(self, config):
+        self.config = config
+        self.filename = os.path.join(config.get('cache-dir'), 'testhistory.sqlite')
+        # only the last runs of a suite count, old failures are fixed by now
+        self.max_runs = 50
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.filename, check_same_thread = False)
+        self.connection.execute("""
+CREATE TABLE IF NOT EXISTS suite_runs (
+    branch      TEXT     NOT NULL,
+    suite       TEXT     NOT NULL,
+    ts          REAL     NOT NULL,
+    duration    INTEGER  NOT NULL,
+    failed      INTEGER  NOT NULL
+)""")
+        self.connection.execute("""
+CREATE INDEX IF NOT EXISTS suite_runs_branch
+          ON suite_runs (branch, suite, ts)""")
+        self.connection.commit()
+
+
+
+    # record()
+    #
+    # add the test results of a job to the history
+    #
+    # parameter:
+    #  - self
+    #  - branch name prefix
+    #  - test timings (see Regress.result())
+    # return:
+    #  none
+    def record(self, branch, timings):
+        now = time.time()
+        with self.lock:
+            for suite in timings:
+                self.connection.execute("INSERT INTO suite_runs (branch, suite, ts, duration, failed) VALUES (?, ?, ?, ?, ?)",
+                                        (branch, suite, now, timings[suite]['time'], len(timings[suite]['failed']) > 0))
+                # expire old runs
+                self.connection.execute("""
+DELETE FROM suite_runs
+ WHERE branch = ?
+   AND suite = ?
+   AND ts < (SELECT MIN(ts)
+               FROM (SELECT ts
+                       FROM suite_runs
+                      WHERE branch = ?
+                        AND suite = ?
+                   ORDER BY ts DESC
+                      LIMIT ?))""", (branch, suite, branch, suite, self.max_runs))
+            self.connection.commit()
+
+
+
+    # suites()
+    #
+    # return statistics for all known suites of a branch
+    #
+    # parameter:
+    #  - self
+    #  - branch name prefix
+    # return:
+    #  - dictionary with suite name and 'runs', 'failure_rate', 'duration' (average ms)
+    def suites(self, branch):
+        with self.lock:
+            rows = self.connection.execute("""
+  SELECT suite, COUNT(*), AVG(failed), AVG(duration)
+    FROM suite_runs
+   WHERE branch = ?
+GROUP BY suite""", (branch,)).fetchall()
+
+        result = {}
+        for row in rows:
+            result[row[0]] = {'runs': row[1], 'failure_rate': row[2], 'duration': row[3]}
+
+        return result
+
+
+
+    # suite_order()
+    #
+    # order the known suites of a branch, the most likely failures first
+    #
+    # parameter:
+    #  - self
+    #  - branch name prefix
+    #  - list with files touched by the patches
+    # return:
+    #  - list with suite names, empty if the branch has no history
+    # note:
+    #  - suites in the directories touched by the patches come first,
+    #    then suites with a high failure rate, then the fast suites
+    def suite_order(self, branch, touched_files):
+        suites = self.suites(branch)
+
+        def relevant(suite):
+            for filename in touched_files:
+                if (filename.startswith(suite + '/')):
+                    return 1
+            return 0
+
+        order = sorted(suites.keys(), key = lambda s: (-relevant(s), -suites[s]['failure_rate'], suites[s]['duration'], s))
+        logging.debug("suite order for " + branch + ": " + ', '.join(order))
+
+        return order
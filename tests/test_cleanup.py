@@ -0,0 +1,64 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from cleanup import Cleanup
+
+
+class FakeConfig:
+
+    def __init__(self, top_dir):
+        self.values = {
+            'build-dir': os.path.join(top_dir, 'build'),
+            'cache-dir': os.path.join(top_dir, 'cache'),
+            'log-dir': os.path.join(top_dir, 'logs'),
+            'log-max-age': 30,
+            'log-max-count': 0,
+        }
+        for name in ['build-dir', 'cache-dir', 'log-dir']:
+            os.mkdir(self.values[name])
+
+    def get(self, name):
+        return self.values[name]
+
+
+class TestLogRetention(unittest.TestCase):
+
+    def setUp(self):
+        self.top_dir = tempfile.mkdtemp()
+        self.config = FakeConfig(self.top_dir)
+        self.cleanup = Cleanup(self.config, None)
+
+    def tearDown(self):
+        shutil.rmtree(self.top_dir, ignore_errors = True)
+
+    def add_log(self, name, days):
+        dir = os.path.join(self.config.get('log-dir'), name)
+        os.mkdir(dir)
+        used = time.time() - days * 86400
+        os.utime(dir, (used, used))
+
+    def logs(self):
+        return sorted(os.listdir(self.config.get('log-dir')))
+
+    def test_max_age(self):
+        self.add_log('2026-01-01_120000_1', 40)
+        self.add_log('2026-01-02_120000_2', 40)
+        self.add_log('2026-02-01_120000_3', 5)
+        self.add_log('unrelated', 40)
+        # a running job
+        self.cleanup.remove_logs([os.path.join(self.config.get('build-dir'), '2026-01-02_120000_2')])
+        self.assertEqual(self.logs(), ['2026-01-02_120000_2', '2026-02-01_120000_3', 'unrelated'])
+
+    def test_max_count(self):
+        self.config.values['log-max-age'] = 0
+        self.config.values['log-max-count'] = 2
+        for number in range(1, 5):
+            self.add_log('2026-02-0' + str(number) + '_120000_' + str(number), 100)
+        self.cleanup.remove_logs([])
+        self.assertEqual(self.logs(), ['2026-02-03_120000_3', '2026-02-04_120000_4'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+import os
+import threading
+import unittest
+
+
+# PGTEST_DSN points to a server where the user can create databases, every
+# test run creates its own database with the schema, and drops it afterwards
+PGTEST_DSN = os.environ.get('PGTEST_DSN')
+SCHEMA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sql', 'database.sql')
+
+if (PGTEST_DSN):
+    import psycopg2
+    import psycopg2.extensions
+    from database import Database
+
+
+class FakeConfig:
+
+    def __init__(self, dsn):
+        args = psycopg2.extensions.parse_dsn(dsn)
+        self.values = {
+            'db-host': args.get('host', ''),
+            'db-port': args.get('port', ''),
+            'db-name': args.get('dbname', ''),
+            'db-user': args.get('user', ''),
+            'db-password': args.get('password', ''),
+            'db-pool-size': 2,
+            'platforms': ['linux'],
+            'build-preflight': False,
+            'affinity': False,
+            'affinity-steal-after': 3600,
+            'poll-interval': 300,
+            'claim-timeout': 3600,
+        }
+
+    def get(self, name):
+        return self.values[name]
+
+
+@unittest.skipUnless(PGTEST_DSN, "PGTEST_DSN is not set")
+class TestClaims(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dbname = 'testtool_test_' + str(os.getpid())
+        conn = psycopg2.connect(PGTEST_DSN)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            cur.execute('CREATE DATABASE "' + cls.dbname + '"')
+        conn.close()
+
+        cls.dsn = psycopg2.extensions.make_dsn(PGTEST_DSN, dbname = cls.dbname)
+        with open(SCHEMA, 'r') as fh:
+            # psql meta commands
+            schema = ''.join([line for line in fh if not line.startswith('\\')])
+        conn = psycopg2.connect(cls.dsn)
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(schema)
+        conn.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        conn = psycopg2.connect(PGTEST_DSN)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            cur.execute('DROP DATABASE IF EXISTS "' + cls.dbname + '"')
+        conn.close()
+
+    def setUp(self):
+        self.hosts = []
+        self.sql("""
+DELETE FROM "public"."commitfest_patch";
+DELETE FROM "public"."commitfest_test_patch";""")
+
+    def tearDown(self):
+        for host in self.hosts:
+            if (host.pool is not None):
+                host.pool.closeall()
+
+    def sql(self, query, parameters = None):
+        conn = psycopg2.connect(self.dsn)
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(query, parameters)
+                rows = []
+                if (cur.description is not None):
+                    rows = cur.fetchall()
+        conn.close()
+        return rows
+
+    def host(self, name):
+        database = Database(FakeConfig(self.dsn))
+        database.worker_name = name
+        self.hosts.append(database)
+        return database
+
+    def queue_jobs(self, number):
+        for i in range(number):
+            self.sql("""
+WITH tp AS (
+     INSERT INTO "public"."commitfest_test_patch"
+                 (name, pg_version, platform)
+          SELECT %(name)s, v.id, p.id
+            FROM "public"."commitfest_test_pg_versions" v,
+                 "public"."commitfest_test_platforms" p
+           WHERE v.branch_name_prefix = 'master'
+             AND p.name = 'linux'
+       RETURNING id
+)
+INSERT INTO "public"."commitfest_patch"
+            (patch, patch_location, patch_type)
+     SELECT tp.id, %(name)s || '@example.org',
+            (SELECT pt.id FROM "public"."commitfest_patch_type" pt WHERE pt.name = 'message-id')
+       FROM tp""", {'name': 'job ' + str(i)})
+
+    def test_concurrent_claims(self):
+        self.queue_jobs(10)
+        hosts = [self.host('host-a'), self.host('host-b')]
+        claimed = {}
+        barrier = threading.Barrier(len(hosts))
+
+        def claim(database):
+            barrier.wait()
+            claimed[database.worker_name] = [job['id'] for job in database.claim_jobs(5)]
+
+        threads = [threading.Thread(target = claim, args = (database,)) for database in hosts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(claimed['host-a']), 5)
+        self.assertEqual(len(claimed['host-b']), 5)
+        self.assertEqual(set(claimed['host-a']) & set(claimed['host-b']), set())
+        for name in claimed:
+            rows = self.sql("""
+SELECT id
+  FROM "public"."commitfest_test_patch"
+ WHERE claimed_by = %(name)s""", {'name': name})
+            self.assertEqual(sorted([row[0] for row in rows]), sorted(claimed[name]))
+
+    def test_expired_claims(self):
+        self.queue_jobs(2)
+        first = self.host('host-a')
+        jobs = [job['id'] for job in first.claim_jobs(2)]
+        self.assertEqual(len(jobs), 2)
+        # host-a died an hour ago, only the second job sent another heartbeat
+        self.sql("""
+UPDATE "public"."commitfest_test_patch"
+   SET ts_started = NOW() - INTERVAL '2 hours',
+       ts_heartbeat = NOW() - INTERVAL '2 hours'""")
+        self.assertEqual(first.heartbeat([jobs[1]]), [jobs[1]])
+
+        second = self.host('host-b')
+        self.assertEqual(second.expire_claims(), 1)
+        self.assertEqual([job['id'] for job in second.claim_jobs(2)], [jobs[0]])
+        # the requeued job belongs to the other host now
+        self.assertEqual(first.heartbeat(jobs), [jobs[1]])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+
+from impact import Impact
+
+
+class TestImpact(unittest.TestCase):
+
+    def setUp(self):
+        self.impact = Impact()
+
+    def test_contrib(self):
+        result = self.impact.analyze(['contrib/hstore/hstore_io.c'])
+        self.assertIs(result['world'], False)
+        self.assertEqual(result['suites'], ['contrib/hstore', 'src/test/regress'])
+
+    def test_docs_only(self):
+        result = self.impact.analyze(['doc/src/sgml/hstore.sgml'])
+        self.assertIs(result['docs-only'], True)
+        self.assertEqual(result['suites'], [])
+
+    def test_build_system(self):
+        self.assertIs(self.impact.analyze(['configure.ac'])['world'], True)
+
+    def test_ignored(self):
+        result = self.impact.analyze(['src/tools/pgindent/typedefs.list', 'src/backend/po/de.po',
+                                      'src/backend/utils/adt/int.c', '.gitignore'])
+        self.assertIs(result['world'], False)
+        self.assertIs(result['docs-only'], False)
+        self.assertEqual(result['suites'], ['src/test/regress'])
+
+    def test_affected(self):
+        self.assertIs(self.impact.affected(['contrib/hstore/hstore_op.c'], ['contrib/hstore/hstore_io.c']), True)
+        self.assertIs(self.impact.affected(['contrib/hstore/hstore_op.c'], ['contrib/cube/cube.c']), False)
+        self.assertIs(self.impact.affected(['configure.ac'], ['contrib/cube/cube.c']), True)
+
+    def test_affected_ignored(self):
+        changed = ['src/tools/pgindent/typedefs.list', 'src/backend/po/de.po']
+        self.assertIs(self.impact.affected(changed, ['contrib/cube/cube.c']), False)
+        self.assertIs(self.impact.affected(changed, ['contrib/cube/cube.c', 'src/tools/pgindent/typedefs.list']), False)
+
+if __name__ == '__main__':
+    unittest.main()
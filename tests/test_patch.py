@@ -0,0 +1,124 @@
+import os
+import hashlib
+import shutil
+import tempfile
+import threading
+import functools
+import unittest
+import http.server
+
+from patch import Patch
+
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+class FakeConfig:
+
+    def __init__(self, cache_dir):
+        self.values = {
+            'cache-dir': cache_dir,
+            'patch-revalidate-interval': 3600,
+            'patch-cache-max-age': 30,
+            'patch-cache-max-size': 100,
+        }
+
+    def get(self, name):
+        return self.values[name]
+
+    def create_hashname(self, name):
+        return hashlib.md5(name.encode('utf-8')).hexdigest()
+
+    def human_size(self, size_bytes):
+        return str(size_bytes) + " bytes"
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestMessageAttachments(unittest.TestCase):
+
+    # the mail archive is replaced by a local HTTP server with the fixtures
+    @classmethod
+    def setUpClass(cls):
+        handler = functools.partial(QuietHandler, directory = FIXTURES)
+        cls.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        cls.thread = threading.Thread(target = cls.server.serve_forever, daemon = True)
+        cls.thread.start()
+        cls.base_url = 'http://127.0.0.1:' + str(cls.server.server_address[1]) + '/'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.patch = Patch(FakeConfig(self.cache_dir))
+        self.patch.patch_url = lambda location, type: self.base_url + location
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors = True)
+
+    def fetch(self, name):
+        filename = self.patch.fetch(name, 'message-id')
+        if (filename is False):
+            return False
+        with open(filename, 'rb') as fh:
+            return fh.read()
+
+    def test_raw_message(self):
+        content = self.fetch('message.eml')
+        self.assertIsNot(content, False)
+        # the first patch has no newline at the end
+        self.assertIn(b'+new\ndiff --git a/src/backend/b.c b/src/backend/b.c\n', content)
+        self.assertLess(content.index(b'a/src/backend/a.c'), content.index(b'a/src/backend/b.c'))
+
+    def test_mbox(self):
+        content = self.fetch('thread.mbox')
+        self.assertIsNot(content, False)
+        self.assertIn(b'+new\ndiff --git a/doc/src/sgml/c.sgml b/doc/src/sgml/c.sgml\n', content)
+        self.assertLess(content.index(b'a/src/backend/a.c'), content.index(b'a/doc/src/sgml/c.sgml'))
+
+    def test_touched_files(self):
+        filename = self.patch.fetch('message.eml', 'message-id')
+        self.assertEqual(self.patch.touched_files([filename]), ['src/backend/a.c', 'src/backend/b.c'])
+
+    def test_broken_gzip(self):
+        self.assertIs(self.fetch('broken.eml'), False)
+        # neither a patch nor a half written file is left behind
+        leftovers = [f for f in os.listdir(self.cache_dir) if f.endswith('.patch') or f.endswith('.unpacked') or '.tmp.' in f]
+        self.assertEqual(leftovers, [])
+
+    def test_no_patch(self):
+        self.assertIs(self.fetch('nopatch.eml'), False)
+
+    def test_cached(self):
+        first = self.patch.fetch('message.eml', 'message-id')
+        # message-ids never change, the cache is used without download
+        self.patch.patch_url = lambda location, type: self.base_url + 'missing.eml'
+        self.assertEqual(self.patch.fetch('message.eml', 'message-id'), first)
+
+    def test_content_file(self):
+        filename = self.patch.fetch('message.eml', 'message-id')
+        self.assertEqual(os.path.basename(filename), self.patch.file_sha256(filename) + '.patch')
+
+    def test_pinned_not_evicted(self):
+        filename = self.patch.fetch('message.eml', 'message-id')
+        # every entry is too old
+        self.patch.config.values['patch-cache-max-age'] = -1
+        self.patch.evict()
+        self.assertTrue(os.path.isfile(filename))
+        self.patch.release([filename])
+        self.patch.evict()
+        self.assertFalse(os.path.isfile(filename))
+        # the patch is downloaded again
+        self.patch.config.values['patch-cache-max-age'] = 30
+        self.assertEqual(self.patch.fetch('message.eml', 'message-id'), filename)
+        self.assertTrue(os.path.isfile(filename))
+
+if __name__ == '__main__':
+    unittest.main()
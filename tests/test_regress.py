@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import subprocess
+import unittest
+
+from regress import Regress
+
+
+# contrib runs pg_regress after building it in src/test/regress, the same
+# way as contrib/contrib-global.mk and pgxs.mk do
+CONTRIB_MAKEFILE = """\
+check:
+\t$(MAKE) -C ../../src/test/regress pg_regress
+\t@echo '# +++ regress check in contrib/hstore +++'
+\t@echo 'ok 1         - hstore                                    512 ms'
+\t@echo 'not ok 2     - hstore_utf8                                 23 ms'
+\t@echo '1..2'
+"""
+
+REGRESS_MAKEFILE = """\
+pg_regress:
+\t$(MAKE) -C ../../port all
+
+check:
+\t@echo 'ok 1         - boolean                                    30 ms'
+"""
+
+PORT_MAKEFILE = """\
+all:
+\t@echo 'built port'
+"""
+
+
+class TestRegress(unittest.TestCase):
+
+    def setUp(self):
+        self.source_dir = tempfile.mkdtemp()
+        for dir, makefile in [('contrib/hstore', CONTRIB_MAKEFILE),
+                              ('src/test/regress', REGRESS_MAKEFILE),
+                              ('src/port', PORT_MAKEFILE)]:
+            os.makedirs(os.path.join(self.source_dir, dir))
+            with open(os.path.join(self.source_dir, dir, 'Makefile'), 'w') as fh:
+                fh.write(makefile)
+
+    def tearDown(self):
+        shutil.rmtree(self.source_dir, ignore_errors = True)
+
+    def make(self, args):
+        if (shutil.which('make') is None):
+            self.skipTest("make is not installed")
+        result = subprocess.run(['make', '-w'] + args, cwd = self.source_dir,
+                                stdout = subprocess.PIPE, stderr = subprocess.STDOUT,
+                                env = dict(os.environ, LANG = 'C', LC_ALL = 'C'),
+                                universal_newlines = True)
+        regress = Regress(self.source_dir)
+        for line in result.stdout.splitlines():
+            regress.parse_line(line)
+        return regress.result()
+
+    def test_contrib_suite(self):
+        result = self.make(['-C', 'contrib/hstore', 'check'])
+        self.assertEqual(list(result.keys()), ['contrib/hstore'])
+        self.assertEqual(result['contrib/hstore']['tests'], {'hstore': 512, 'hstore_utf8': 23})
+        self.assertEqual(result['contrib/hstore']['failed'], ['hstore_utf8'])
+
+    def test_core_suite(self):
+        result = self.make(['-C', 'src/test/regress', 'check'])
+        self.assertEqual(list(result.keys()), ['src/test/regress'])
+        self.assertEqual(result['src/test/regress']['tests'], {'boolean': 30})
+
+if __name__ == '__main__':
+    unittest.main()
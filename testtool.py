@@ -21,7 +21,23 @@ import datetime
 from time import gmtime, localtime, strftime
 # config functions
 from config import Config
+from scheduler import Scheduler
+from repository import Repository
+from patch import Patch
+from database import Database
+from stagelog import StageLog
+from build import Build
+from preflight import Preflight
+from testhistory import TestHistory
+from journal import Journal
+from cleanup import Cleanup
+from diskspace import DiskSpace
+from retest import Retest
+from policy import Policy
+from affinity import Affinity
+from archive import Archive
 import copy
+import signal
 
 
 # start with 'info', can be overriden by '-q' later on
@@ -32,21 +48,254 @@ logging.basicConfig(level = logging.INFO,
 # exit_handler()
 #
 # exit handler, called upon exit of the script
-# main job: remove the temp directory
+# main job: close the job journal, unfinished jobs stay in it
 #
 # parameters:
 #  none
 # return:
 #  none
 def exit_handler():
-    # do something in the end ...
-    pass
+    if ('journal' in globals()):
+        journal.close()
 
 # register exit handler
 atexit.register(exit_handler)
 
 
 
+# fetch_jobs()
+#
+# fetch new jobs from the queue
+#
+# parameters:
+#  - maximum number of jobs
+# return:
+#  - list with jobs
+# note:
+#  - called on every poll, with 0 if all slots are in use
+def fetch_jobs(number):
+    # keep the claims of the running jobs alive, requeue jobs of dead hosts
+    database.heartbeat(scheduler.running_jobs())
+    database.expire_claims()
+    # remove old builds, before new jobs need the space
+    cleanup.retention(scheduler.running_build_dirs())
+    # next month's partitions, and old stage logs into the archive
+    try:
+        archive.maintain()
+    except Exception:
+        logging.exception("partition maintenance failed")
+
+    # queue patches again which are affected by new commits
+    if (config.get('retest') is True):
+        retest.maintain()
+
+    # fail jobs with patches which don't apply, before they use a slot
+    if (config.get('build-preflight') is True):
+        preflight.run(4 * config.get('number-parallel-jobs'))
+
+    # every job needs a few GB, don't start jobs which run out of space
+    number = diskspace.admit(number, scheduler.running_build_dirs())
+
+    jobs = policy.claim_jobs(number, idle = len(scheduler.running_jobs()) == 0)
+
+    # tell the other hosts which branches are warm here, and if there is
+    # still room for more jobs
+    if (config.get('affinity') is True):
+        affinity.advertise(number - len(jobs))
+
+    return jobs
+
+
+
+# run_job()
+#
+# run a single job, called in a worker thread
+#
+# parameters:
+#  - job
+#  - scheduler
+# return:
+#  none
+def run_job(job, scheduler):
+    logging.info("job " + str(job['id']) + " in " + job['build-dir'])
+    job['logs'] = {}
+    if (job.get('resumed') is not True):
+        job['start_time'] = datetime.datetime.now(datetime.timezone.utc)
+        job['log-dir'] = os.path.join(config.get('log-dir'), os.path.basename(job['build-dir']))
+        os.mkdir(job['log-dir'])
+        # a resumed job keeps the stage where it continues
+        journal.update(job, 'started')
+
+    try:
+        state = run_stages(job, scheduler)
+    except Exception:
+        logging.exception("job " + str(job['id']) + ": unexpected error")
+        job['errorstr'] = 'unexpected error'
+        state = 'aborted'
+
+    for stage in job['logs']:
+        job['logs'][stage].close()
+    if (job.get('patch-files')):
+        patch.release(job['patch-files'])
+    diskspace.record(job)
+    if (state == 'failed' and job.get('out-of-space') is True):
+        # not a problem of the patch, try again later
+        logging.error("job " + str(job['id']) + ": out of disk space, requeue")
+        database.release_claims([job['id']])
+        journal.remove(job['id'])
+        return
+    job['end_time'] = datetime.datetime.now(datetime.timezone.utc)
+    if ('reused-result' in job):
+        database.copy_result(job['id'], job['reused-result'])
+    else:
+        database.store_result(job)
+    database.finish_job(job['id'], state)
+    journal.remove(job['id'])
+
+
+
+# stage_log()
+#
+# open the log for a stage of a job
+#
+# parameters:
+#  - job
+#  - stage name
+# return:
+#  - StageLog
+def stage_log(job, stage):
+    if not (stage in job['logs']):
+        # the journal knows where to continue after a crash
+        journal.update(job, stage)
+        job['logs'][stage] = StageLog(config, os.path.join(job['log-dir'], stage + '.log.gz'))
+
+    return job['logs'][stage]
+
+
+
+# run_stages()
+#
+# run all stages of a job
+#
+# parameters:
+#  - job
+#  - scheduler
+# return:
+#  - job state ('aborted', 'failed', 'success')
+def run_stages(job, scheduler):
+    if (job.get('resumed') is True):
+        # source directory and patches are still in place
+        logging.info("job " + str(job['id']) + ": resume in stage " + job['journal-stage'])
+        return build.run(job, lambda stage: stage_log(job, stage))
+
+    # download the patches, every patch is only downloaded once for all jobs
+    job['patch-files'] = patch.fetch_patchset(job['patches'])
+    if (job['patch-files'] is False):
+        job['errorstr'] = 'cannot download patches'
+        logging.error("job " + str(job['id']) + ": " + job['errorstr'])
+        return 'aborted'
+    database.set_patch_size(job['id'], sum([os.path.getsize(f) for f in job['patch-files']]))
+
+    # stage: git update
+    log = stage_log(job, 'git_update')
+    start_time = time.time()
+    job['result_git_update'] = 1
+    if (repository.update_mirror() is False):
+        job['errorstr'] = 'cannot update repository'
+        logging.error("job " + str(job['id']) + ": " + job['errorstr'])
+        return 'aborted'
+    job['branch'] = repository.branch_name(job['branch_name_prefix'])
+    job['git_revision'] = repository.branch_revision(job['branch_name_prefix'])
+    if (job['branch'] is False or job['git_revision'] is False):
+        job['errorstr'] = 'unknown branch ' + job['branch_name_prefix']
+        logging.error("job " + str(job['id']) + ": " + job['errorstr'])
+        return 'aborted'
+    job['time_git_update'] = time.time() - start_time
+    log.write("branch: " + job['branch'] + "\nrevision: " + job['git_revision'] + "\n")
+    database.set_git_revision(job['id'], job['git_revision'])
+    if (config.get('build-reuse-results') is True):
+        job['result_key'] = result_key(job)
+        prior = database.find_result(job['result_key'])
+        if (prior is not None):
+            # nothing changed since the last test
+            log.write("identical test, reuse result " + str(prior['id']) + "\n")
+            logging.info("job " + str(job['id']) + ": reuse result " + str(prior['id']))
+            job['reused-result'] = prior['id']
+            return prior['state']
+    # a new snapshot builds the whole branch, this is not part of the update
+    start_time = time.time()
+    if (build.prepare_source(job, log) is False):
+        job['errorstr'] = 'cannot prepare source directory'
+        logging.error("job " + str(job['id']) + ": " + job['errorstr'])
+        return 'aborted'
+    job['time_prepare_source'] = time.time() - start_time
+    job['result_git_update'] = 0
+
+    # stages: patch, configure, make, install, tests
+    return build.run(job, lambda stage: stage_log(job, stage))
+
+
+
+# recover_jobs()
+#
+# find the jobs which were running when the tool stopped last time
+#
+# parameters:
+#  none
+# return:
+#  - list with jobs which continue where they stopped
+# note:
+#  - a job continues if it is still claimed by this host, and the source
+#    directory is already patched, all other jobs are returned into the queue
+def recover_jobs():
+    jobs = journal.unfinished()
+    if (len(jobs) == 0):
+        return []
+
+    claimed = database.heartbeat([job['id'] for job in jobs])
+    resume = []
+    for job in jobs:
+        if (job['id'] in claimed and journal.resumable(job) is True):
+            job['resumed'] = True
+            resume.append(job)
+        else:
+            logging.info("job " + str(job['id']) + " cannot resume (stage " + job['journal-stage'] + "), requeue")
+            journal.remove(job['id'])
+
+    return resume
+
+
+
+# result_key()
+#
+# return the key of all inputs which determine the result of a job
+#
+# parameters:
+#  - job
+# return:
+#  - hash
+def result_key(job):
+    return config.create_hashname(' '.join([patch.patchset_hash(job['patch-files']), job['git_revision'],
+                                            job['branch_name_prefix'], job['platform_name'],
+                                            config.get('tests-mode')] + config.get('build-options')))
+
+
+
+# signal_handler()
+#
+# stop accepting new jobs, running jobs will finish
+#
+# parameters:
+#  - signal number
+#  - stack frame
+# return:
+#  none
+def signal_handler(signum, frame):
+    logging.info("received signal " + str(signum) + ", waiting for running jobs")
+    scheduler.stop()
+
+
+
 #######################################################################
 # main code
 
@@ -64,13 +313,45 @@ config.build_and_verify_config()
 
 # by now the lockfile is acquired, there is no other instance running
 # before starting new jobs, cleanup remaining old ones
+journal = Journal(config)
+database = Database(config)
+resume = recover_jobs()
 
 # startup
-config.cleanup_old_dirs_and_files()
+repository = Repository(config)
+cleanup = Cleanup(config, repository)
+cleanup.startup([job['build-dir'] for job in resume], sum([job['patch-files'] for job in resume], []))
+diskspace = DiskSpace(config, cleanup)
 
 
 
 # main mode
+if (repository.init_mirror() is False):
+    logging.error("cannot clone repository: " + config.get('repository-url'))
+    sys.exit(1)
 
+patch = Patch(config)
+# the patches of resumed jobs must not be evicted
+for job in resume:
+    for filename in job['patch-files']:
+        patch.pin(filename)
 
+# jobs claimed by a previous run of this host are not running anymore
+database.release_claims(keep = [job['id'] for job in resume])
 
+scheduler = Scheduler(config)
+signal.signal(signal.SIGINT, signal_handler)
+signal.signal(signal.SIGTERM, signal_handler)
+# new jobs wake up the scheduler immediately
+database.start_listener(scheduler.wakeup)
+build = Build(config, scheduler, repository, patch, TestHistory(config))
+preflight = Preflight(config, database, repository, patch)
+retest = Retest(config, database, repository, patch)
+policy = Policy(config, database)
+affinity = Affinity(config, database, repository, build)
+archive = Archive(config, database)
+# the partition for this month has to exist before the first result
+archive.maintain()
+for job in resume:
+    scheduler.start_job(job, run_job)
+scheduler.run(fetch_jobs, run_job)